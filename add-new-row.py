@@ -1,10 +1,25 @@
 import os
+import re
 import sys
 import json
-import requests
+import time
 import argparse
-from notion_client import Client as NotionClient
+import threading
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from cache_store import CacheStore, make_key
+from api_utils import make_notion_client, notion_call, rate_limited
+
+try:
+    import orjson
+    json_loads = orjson.loads
+    json_dumps = orjson.dumps
+except ImportError:
+    # orjson is optional; the standard library produces the same results, just slower
+    json_loads = json.loads
+    def json_dumps(obj):
+        return json.dumps(obj).encode("utf-8")
 
 load_dotenv()
 
@@ -12,18 +27,91 @@ NOTION_KEY = os.getenv("NOTION_KEY")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_ENDPOINT = os.getenv("OPENAI_ENDPOINT", "https://api.openai.com/v1/responses")
 
-notion = NotionClient(auth=NOTION_KEY)
+# The Notion client and the requests session are created on first use so that
+# `--help` and missing-config errors don't pay for importing notion_client/requests
+_notion = None
+_session = None
+_client_lock = threading.Lock()
+
+def get_notion():
+    """Return the shared Notion client, importing notion_client on first use."""
+    global _notion
+    with _client_lock:
+        if _notion is None:
+            _notion = make_notion_client(NOTION_KEY)
+    return _notion
+
+def get_session():
+    """Return the shared HTTP session, importing requests on first use.
+    
+    Reusing one session keeps the connection to OpenAI alive between calls.
+    """
+    global _session
+    with _client_lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+            
+            session = requests.Session()
+            session.mount("https://", HTTPAdapter(
+                pool_connections=4,
+                pool_maxsize=10,
+                max_retries=Retry(
+                    total=3,
+                    backoff_factor=0.5,
+                    status_forcelist=[429, 500, 502, 503, 504],
+                    allowed_methods=frozenset({"POST"}),
+                    raise_on_status=False  # Hand back the last response so its error body gets printed
+                )
+            ))
+            # Static headers are set once here instead of being rebuilt for every call
+            session.headers.update({
+                "Authorization": f"Bearer {OPENAI_API_KEY}",
+                "Content-Type": "application/json"
+            })
+            _session = session
+    return _session
+
+# The Batch API endpoints live next to the configured Responses endpoint
+OPENAI_API_BASE = OPENAI_ENDPOINT.rstrip("/").rsplit("/", 1)[0]
+
+# Batch API jobs are polled until they reach one of these states
+BATCH_FINAL_STATUSES = frozenset({"completed", "failed", "expired", "cancelled"})
+BATCH_MAX_POLL_INTERVAL = 60
+
+# (connect, read) timeouts in seconds so a stalled connection can't hang the run
+OPENAI_TIMEOUT = (5, 60)
+
+# Concurrency limits for OpenAI calls and Notion writes (Notion allows about
+# 3 requests per second per integration), and the most conditions in one "or" filter
+MAX_WORKERS = 8
+NOTION_MAX_WORKERS = 3
+MAX_OR_FILTERS = 100
+
+# Patterns used to turn a database name into an env var prefix
+_NON_ALNUM = re.compile(r'[^A-Za-z0-9]')
+_MULTI_UNDERSCORE = re.compile(r'_+')
+
+# Database schemas rarely change, so remember lookups for a day
+SCHEMA_CACHE = CacheStore("notion_schema")
+SCHEMA_CACHE_TTL = 24 * 60 * 60
+
+# Generated rows, keyed by the exact request, so re-running the same input is free
+RESPONSE_CACHE = CacheStore("openai_responses")
+RESPONSE_CACHE_TTL = 7 * 24 * 60 * 60
+
+# Resolved prompt configs, kept for the life of the process
+_PROMPT_CONFIG_CACHE = {}
 
 def get_custom_prompt_config(database_name):
     """Get custom prompt ID and version for the specified database."""
-    # Convert database name to env var format (uppercase, normalize special characters)
-    # Replace spaces, hyphens, and other special chars with underscores
-    import re
-    db_env_name = re.sub(r'[^A-Za-z0-9]', '_', database_name.upper())
-    # Remove multiple consecutive underscores
-    db_env_name = re.sub(r'_+', '_', db_env_name)
-    # Remove leading/trailing underscores
-    db_env_name = db_env_name.strip('_')
+    if database_name in _PROMPT_CONFIG_CACHE:
+        return _PROMPT_CONFIG_CACHE[database_name]
+    
+    # Convert database name to env var format (uppercase, normalize special characters):
+    # special chars become underscores, runs of underscores collapse, and the ends are trimmed
+    db_env_name = _MULTI_UNDERSCORE.sub('_', _NON_ALNUM.sub('_', database_name.upper())).strip('_')
     
     prompt_id = os.getenv(f"{db_env_name}_PROMPT_ID")
     prompt_version = os.getenv(f"{db_env_name}_PROMPT_VERSION")
@@ -43,99 +131,275 @@ def get_custom_prompt_config(database_name):
     
     print(f"🎯 Using custom prompt for '{database_name}' (env prefix: {db_env_name})")
     print(f"   ID: {prompt_id}, Version: {prompt_version}")
+    _PROMPT_CONFIG_CACHE[database_name] = (prompt_id, prompt_version)
     return prompt_id, prompt_version
 
-def call_openai_custom_prompt(prompt_id, prompt_version, input_text):
+# Parts of the Responses API request that are the same for every row
+_PAYLOAD_TEMPLATE = {
+    "model": "gpt-4o",
+    "text": {"format": {"type": "json_object"}}
+}
+
+def make_payload_builder(prompt_id, prompt_version, database_properties=None):
+    """Return a function that builds the Responses API request body for one input row.
+    
+    Everything except the input text is worked out once up front, so building
+    many rows for the same database only formats the input. When
+    database_properties is given, the prompt lists the database's property names
+    and types so the AI doesn't invent keys that would be skipped.
+    """
+    prompt = {"id": prompt_id, "version": prompt_version}
+    if database_properties:
+        prefix = f"Return JSON only with exactly these keys and types: {json.dumps(database_properties)}. Content: "
+    else:
+        prefix = "Return JSON only: "
+    
+    def build(input_text):
+        return {**_PAYLOAD_TEMPLATE, "prompt": prompt, "input": prefix + input_text}
+    
+    return build
+
+def build_openai_payload(prompt_id, prompt_version, input_text, database_properties=None):
+    """Build the Responses API request body for one input row."""
+    return make_payload_builder(prompt_id, prompt_version, database_properties)(input_text)
+
+def parse_openai_output(data):
+    """Pull the generated JSON out of a Responses API response body."""
+    # Responses API structure - check for 'output' field
+    if "output" in data:
+        output_items = data["output"]          # <- this is a list
+        if not output_items:
+            print("❌ Empty output list")
+            return None
+
+        # grab the first message’s text
+        first_item = output_items[0]
+        txt = "".join(
+            part.get("text", "")
+            for part in first_item.get("content", [])
+            if part.get("type") == "output_text"
+        )
+
+        if not txt:
+            print("❌ No output_text found in first message")
+            return None
+
+        # try to parse the text as JSON
+        try:
+            parsed = json_loads(txt)
+            return parsed
+        except json.JSONDecodeError:
+            print("⚠️  Output wasn’t valid JSON, returning raw text")
+            return txt
+        
+    else:
+        print("❌ No 'output' field found in Responses API response")
+        print(f"   Available fields: {list(data.keys())}")
+        return None
+
+def get_cached_response(payload):
+    """Return the JSON previously generated for this exact request, or None."""
+    return RESPONSE_CACHE.get(make_key(payload))
+
+def cache_response(payload, parsed):
+    """Remember a generated row; raw text that wasn't valid JSON is never cached."""
+    if isinstance(parsed, (dict, list)):
+        RESPONSE_CACHE.set(make_key(payload), parsed, expire=RESPONSE_CACHE_TTL)
+
+def call_openai_custom_prompt(prompt_id, prompt_version, input_text, database_properties=None,
+                              session=None, use_cache=True):
     """Call OpenAI Responses API with custom prompt to generate JSON output."""
+    import requests
+    
     print(f"🤖 Calling custom prompt for: {input_text[:50]}...")
     
     if not OPENAI_API_KEY:
         print("⚠️  OPENAI_API_KEY not found in environment variables")
         return None
     
-    headers = {
-        "Authorization": f"Bearer {OPENAI_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    
     # Construct payload for Responses API
-    url = "https://api.openai.com/v1/responses"
-    payload = {
-        "prompt": {"id": prompt_id, "version": prompt_version},
-        "input": f"Return JSON only: {input_text}",
-        "model": "gpt-4o",
-        "text": {"format": {"type": "json_object"}}
-    }
+    url = OPENAI_ENDPOINT
+    payload = build_openai_payload(prompt_id, prompt_version, input_text, database_properties)
+    
+    if use_cache:
+        cached = get_cached_response(payload)
+        if cached is not None:
+            print(f"⚡ Using cached response for: {input_text[:50]}")
+            return cached
     
     try:
-        response = requests.post(
+        response = (session or get_session()).post(
             url,
-            headers=headers,
-            json=payload
+            data=json_dumps(payload),
+            timeout=OPENAI_TIMEOUT
         )
+        response.raise_for_status()
+        
+        # Decode straight from the raw bytes to skip building an intermediate str
+        parsed = parse_openai_output(json_loads(response.content))
+        cache_response(payload, parsed)
+        return parsed
+        
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f"❌ Error calling OpenAI Responses API: {e}")
+        # The error body says why OpenAI rejected the request
+        if getattr(e, "response", None) is not None:
+            print(f"   Response content: {e.response.text}")
+        return None
 
-        #  --- temporary debug -------------
-        if response.status_code >= 400:
-            print("==== OpenAI returned ====")
-            print(response.status_code, response.text)   # <-- see the real reason
+def call_openai_batch(prompt_id, prompt_version, input_texts, database_properties=None,
+                      session=None, use_cache=True):
+    """Generate every row through the OpenAI Batch API; returns one response per input.
+    
+    Batches cost half as much as individual calls and don't count against the
+    regular rate limits, but can take minutes (up to 24h) to finish. Inputs whose
+    request failed come back as None. Inputs with a cached response are not sent.
+    """
+    import requests
+    
+    build_payload = make_payload_builder(prompt_id, prompt_version, database_properties)
+    payloads = [build_payload(input_text) for input_text in input_texts]
+    
+    results = {}
+    if use_cache:
+        for i, payload in enumerate(payloads):
+            cached = get_cached_response(payload)
+            if cached is not None:
+                results[f"row-{i}"] = cached
+        if results:
+            print(f"⚡ Using cached responses for {len(results)} of {len(payloads)} rows")
+    
+    lines = [
+        json_dumps({
+            "custom_id": f"row-{i}",
+            "method": "POST",
+            "url": "/v1/responses",
+            "body": payload
+        })
+        for i, payload in enumerate(payloads)
+        if f"row-{i}" not in results
+    ]
+    if not lines:
+        return [results[f"row-{i}"] for i in range(len(payloads))]
+    
+    session = session or get_session()
+    print(f"📦 Submitting {len(lines)} rows to the OpenAI Batch API...")
+    
+    try:
+        # Drop the session's JSON content type so requests can set the multipart one
+        response = session.post(
+            f"{OPENAI_API_BASE}/files",
+            data={"purpose": "batch"},
+            files={"file": ("batch.jsonl", b"\n".join(lines))},
+            headers={"Content-Type": None},
+            timeout=OPENAI_TIMEOUT
+        )
+        response.raise_for_status()
+        
+        response = session.post(
+            f"{OPENAI_API_BASE}/batches",
+            data=json_dumps({
+                "input_file_id": json_loads(response.content)["id"],
+                "endpoint": "/v1/responses",
+                "completion_window": "24h"
+            }),
+            timeout=OPENAI_TIMEOUT
+        )
+        response.raise_for_status()
+        batch = json_loads(response.content)
+        print(f"⏳ Batch {batch['id']} submitted, waiting for it to finish...")
+        
+        # Poll with exponential backoff, capped at a minute between checks
+        attempt = 0
+        while batch["status"] not in BATCH_FINAL_STATUSES:
+            time.sleep(min(BATCH_MAX_POLL_INTERVAL, 2 ** attempt))
+            attempt += 1
+            response = session.get(f"{OPENAI_API_BASE}/batches/{batch['id']}", timeout=OPENAI_TIMEOUT)
             response.raise_for_status()
-        #  ---------------------------------
+            batch = json_loads(response.content)
+            counts = batch.get("request_counts") or {}
+            print(f"   {batch['status']}: {counts.get('completed', 0)}/{counts.get('total', len(input_texts))} done")
         
-        data = response.json()
+        if not batch.get("output_file_id"):
+            print(f"❌ Batch {batch['id']} ended with status '{batch['status']}' and no output")
+            return [results.get(f"row-{i}") for i in range(len(input_texts))]
         
-        # Responses API structure - check for 'output' field
-        if "output" in data:
-            output_items = data["output"]          # <- this is a list
-            if not output_items:
-                print("❌ Empty output list")
-                return None
-
-            # grab the first message’s text
-            first_item = output_items[0]
-            txt = ""
-            for part in first_item.get("content", []):
-                if part.get("type") == "output_text":
-                    txt += part.get("text", "")
-
-            if not txt:
-                print("❌ No output_text found in first message")
-                return None
-
-            # try to parse the text as JSON
-            try:
-                parsed = json.loads(txt)
-                return parsed
-            except json.JSONDecodeError:
-                print("⚠️  Output wasn’t valid JSON, returning raw text")
-                return txt
-            
-        else:
-            print("❌ No 'output' field found in Responses API response")
-            print(f"   Available fields: {list(data.keys())}")
-            return None
+        response = session.get(
+            f"{OPENAI_API_BASE}/files/{batch['output_file_id']}/content",
+            timeout=OPENAI_TIMEOUT
+        )
+        response.raise_for_status()
         
     except requests.exceptions.RequestException as e:
-        print(f"❌ Error calling OpenAI Responses API: {e}")
-        return None
+        print(f"❌ Error calling OpenAI Batch API: {e}")
+        return [results.get(f"row-{i}") for i in range(len(input_texts))]
+    
+    # Results come back in completion order, so match them up by custom_id
+    for line in response.content.splitlines():
+        if not line.strip():
+            continue
+        result = json_loads(line)
+        body = (result.get("response") or {}).get("body")
+        if result.get("error") or not body or result["response"].get("status_code", 200) >= 400:
+            print(f"❌ Batch request {result.get('custom_id')} failed: {result.get('error') or body}")
+            continue
+        parsed = parse_openai_output(body)
+        results[result["custom_id"]] = parsed
+        cache_response(payloads[int(result["custom_id"].split("-")[1])], parsed)
+    
+    return [results.get(f"row-{i}") for i in range(len(input_texts))]
 
-def get_database_by_name(database_name):
-    """Find a database by its title/name."""
+def get_database_by_name(database_name, refresh=False):
+    """Find a database by its title/name, using the local schema cache when possible."""
+    cache_key = make_key(NOTION_KEY, database_name.lower())
+    
+    if refresh:
+        SCHEMA_CACHE.delete(cache_key)
+    else:
+        cached = SCHEMA_CACHE.get(cache_key)
+        if cached:
+            print(f"⚡ Using cached schema for database: {database_name} (ID: {cached['id']})")
+            return cached["id"], cached
+    
     print(f"🔍 Searching for database: {database_name}")
     
     try:
-        response = notion.search(
-            filter={"property": "object", "value": "database"}
+        # Let Notion narrow the results by title instead of listing every database
+        from notion_client.helpers import iterate_paginated_api
+        
+        notion = get_notion()
+        
+        # Pages are fetched lazily, so this stops at the first exact title match
+        db = find_database_match(
+            iterate_paginated_api(
+                rate_limited(notion.search),
+                query=database_name,
+                filter={"property": "object", "value": "database"},
+                page_size=100
+            ),
+            database_name
         )
         
-        databases = response.get("results", [])
+        if not db:
+            # Title search is fuzzy, so fall back once to paging through all databases
+            print("🔍 No match from title search, checking all accessible databases...")
+            db = find_database_match(
+                iterate_paginated_api(
+                    rate_limited(notion.search),
+                    filter={"property": "object", "value": "database"},
+                    page_size=100
+                ),
+                database_name
+            )
         
-        for db in databases:
-            title_property = db.get("title", [])
-            if title_property:
-                db_title = title_property[0].get("plain_text", "")
-                if db_title.lower() == database_name.lower():
-                    print(f"🎯 Found database: {db_title} (ID: {db['id']})")
-                    return db["id"], db
+        if db:
+            print(f"🎯 Found database: {db['title'][0].get('plain_text', '')} (ID: {db['id']})")
+            SCHEMA_CACHE.set(
+                cache_key,
+                {"id": db["id"], "properties": db.get("properties", {})},
+                expire=SCHEMA_CACHE_TTL
+            )
+            return db["id"], db
         
         print(f"❌ Database '{database_name}' not found")
         return None, None
@@ -144,137 +408,262 @@ def get_database_by_name(database_name):
         print(f"❌ Error searching for database: {e}")
         return None, None
 
+def find_database_match(databases, database_name):
+    """Return the first database whose title matches database_name (case-insensitive).
+    
+    databases may be a lazy iterator; nothing past the match is consumed.
+    """
+    target = database_name.casefold()
+    return next(
+        (db for db in databases
+         if db.get("title") and db["title"][0].get("plain_text", "").casefold() == target),
+        None
+    )
+
 def get_database_properties(database):
     """Extract property names and types from database schema."""
-    properties = database.get("properties", {})
-    prop_info = {}
-    
-    for prop_name, prop_data in properties.items():
-        prop_type = prop_data.get("type")
-        prop_info[prop_name] = prop_type
-    
-    print(f"📋 Database properties found: {list(prop_info.keys())}")
-    return prop_info
+    return {name: data["type"] for name, data in database.get("properties", {}).items()}
+
+# Property types that can be used as the key, matched with an "equals" filter
+_STRING_KEY_TYPES = frozenset({"title", "rich_text", "url", "email", "phone_number", "select"})
+KEY_PROPERTY_TYPES = _STRING_KEY_TYPES | {"number", "unique_id"}
+_TRAILING_DIGITS = re.compile(r'(\d+)$')
+
+def normalize_key_value(key_type, value):
+    """Convert a key value to the form Notion filters on, or None if it can't match."""
+    if key_type in _STRING_KEY_TYPES:
+        return str(value)
+    if key_type == "number":
+        try:
+            return float(value)
+        except (ValueError, TypeError):
+            return None
+    if key_type == "unique_id":
+        # Unique IDs are filtered by number only, e.g. "MOV-12" -> 12
+        match = _TRAILING_DIGITS.search(str(value))
+        return int(match.group(1)) if match else None
+    return None
 
-def find_existing_page(database_id, key_property, key_value):
+def find_existing_page(database_id, key_property, key_value, key_type="rich_text"):
     """Find an existing page in the database with the specified key property value."""
     print(f"🔍 Searching for existing page with {key_property} = '{key_value}'")
     
     try:
-        response = notion.databases.query(
-            database_id=database_id,
-            filter={
-                "property": key_property,
-                "rich_text": {
-                    "equals": key_value
-                }
-            }
-        )
-        
-        pages = response.get("results", [])
-        
-        if pages:
-            page = pages[0]  # Take the first match
-            print(f"✅ Found existing page: {page['id']}")
-            return page["id"]
-        else:
-            print(f"📝 No existing page found with {key_property} = '{key_value}'")
-            return None
-            
+        page_id = find_existing_pages(database_id, key_property, [key_value], key_type).get(str(key_value))
     except Exception as e:
         print(f"❌ Error searching for existing page: {e}")
         return None
+    
+    if page_id:
+        print(f"✅ Found existing page: {page_id}")
+    else:
+        print(f"📝 No existing page found with {key_property} = '{key_value}'")
+    return page_id
 
-def format_property_value(value, prop_type):
-    """Format a value according to Notion property type."""
-    if prop_type == "title":
-        return {
-            "title": [
-                {
-                    "type": "text",
-                    "text": {"content": str(value)}
-                }
+def find_existing_pages(database_id, key_property, key_values, key_type="rich_text"):
+    """Map each key value (as a string) to the id of the first page that has it.
+    
+    Looks up many keys with one compound "or" query per 100 values instead of
+    one query per key. Keys without a matching page are left out of the result.
+    The filter is built for the key property's type (title, rich_text, number...).
+    """
+    from notion_client.helpers import iterate_paginated_api
+    
+    notion = get_notion()
+    
+    # Map each normalized value back to the key value it came from
+    originals = {}
+    for key_value in key_values:
+        value = normalize_key_value(key_type, key_value)
+        if value is None:
+            print(f"⚠️  Cannot match '{key_value}' against {key_type} property '{key_property}'")
+            continue
+        originals.setdefault(value, str(key_value))
+    
+    wanted = list(originals)
+    found = {}
+    
+    for start in range(0, len(wanted), MAX_OR_FILTERS):
+        chunk = wanted[start:start + MAX_OR_FILTERS]
+        key_filter = {
+            "or": [
+                {"property": key_property, key_type: {"equals": value}}
+                for value in chunk
             ]
         }
-    elif prop_type == "rich_text":
-        return {
-            "rich_text": [
-                {
-                    "type": "text",
-                    "text": {"content": str(value)}
-                }
-            ]
+        for page in iterate_paginated_api(
+            rate_limited(notion.databases.query),
+            database_id=database_id,
+            filter=key_filter,
+            page_size=100
+        ):
+            value = get_page_key_value(page, key_property)
+            if value in originals:
+                found.setdefault(originals[value], page["id"])  # Take the first match
+    
+    return found
+
+def get_page_key_value(page, key_property):
+    """Read the key property from a Notion page in the form normalize_key_value returns."""
+    prop = page.get("properties", {}).get(key_property, {})
+    prop_type = prop.get("type")
+    if prop_type in ("title", "rich_text"):
+        return "".join(part.get("plain_text", "") for part in prop.get(prop_type, []))
+    if prop_type == "select":
+        return (prop.get("select") or {}).get("name")
+    if prop_type == "unique_id":
+        return (prop.get("unique_id") or {}).get("number")
+    if prop_type in KEY_PROPERTY_TYPES:
+        return prop.get(prop_type)
+    return None
+
+# Accepted spellings for checkbox values
+_TRUTHY = frozenset({"true", "yes", "1"})
+_FALSY = frozenset({"false", "no", "0"})
+
+def _fmt_title(value):
+    return {
+        "title": [
+            {
+                "type": "text",
+                "text": {"content": str(value)}
+            }
+        ]
+    }
+
+def _fmt_rich_text(value):
+    return {
+        "rich_text": [
+            {
+                "type": "text",
+                "text": {"content": str(value)}
+            }
+        ]
+    }
+
+def _fmt_number(value):
+    try:
+        return {"number": float(value)}
+    except (ValueError, TypeError):
+        print(f"⚠️  Cannot convert '{value}' to number")
+        return None
+
+def _fmt_checkbox(value):
+    if isinstance(value, bool):
+        return {"checkbox": value}
+    text = str(value).lower()
+    if text in _TRUTHY:
+        return {"checkbox": True}
+    if text in _FALSY:
+        return {"checkbox": False}
+    print(f"⚠️  Cannot convert '{value}' to checkbox")
+    return None
+
+def _fmt_select(value):
+    return {
+        "select": {
+            "name": str(value)
         }
-    elif prop_type == "number":
-        try:
-            return {"number": float(value)}
-        except (ValueError, TypeError):
-            print(f"⚠️  Cannot convert '{value}' to number")
-            return None
-    elif prop_type == "checkbox":
-        if isinstance(value, bool):
-            return {"checkbox": value}
-        elif str(value).lower() in ["true", "yes", "1"]:
-            return {"checkbox": True}
-        elif str(value).lower() in ["false", "no", "0"]:
-            return {"checkbox": False}
-        else:
-            print(f"⚠️  Cannot convert '{value}' to checkbox")
-            return None
-    elif prop_type == "select":
+    }
+
+def _fmt_multi_select(value):
+    if isinstance(value, list):
         return {
-            "select": {
-                "name": str(value)
-            }
+            "multi_select": [{"name": str(v)} for v in value]
         }
-    elif prop_type == "multi_select":
-        if isinstance(value, list):
-            return {
-                "multi_select": [{"name": str(v)} for v in value]
-            }
-        else:
-            return {
-                "multi_select": [{"name": str(value)}]
-            }
-    elif prop_type == "url":
-        return {"url": str(value)}
-    elif prop_type == "email":
-        return {"email": str(value)}
-    elif prop_type == "phone_number":
-        return {"phone_number": str(value)}
-    else:
+    return {
+        "multi_select": [{"name": str(value)}]
+    }
+
+def _fmt_url(value):
+    return {"url": str(value)}
+
+def _fmt_email(value):
+    return {"email": str(value)}
+
+def _fmt_phone_number(value):
+    return {"phone_number": str(value)}
+
+# Notion property type -> formatter
+_FORMATTERS = {
+    "title": _fmt_title,
+    "rich_text": _fmt_rich_text,
+    "number": _fmt_number,
+    "checkbox": _fmt_checkbox,
+    "select": _fmt_select,
+    "multi_select": _fmt_multi_select,
+    "url": _fmt_url,
+    "email": _fmt_email,
+    "phone_number": _fmt_phone_number,
+}
+
+def format_property_value(value, prop_type):
+    """Format a value according to Notion property type."""
+    formatter = _FORMATTERS.get(prop_type)
+    if formatter is None:
         print(f"⚠️  Unsupported property type: {prop_type}")
         return None
+    return formatter(value)
 
-def create_or_update_page(database_id, page_id, json_data, database_properties, key_property):
-    """Create a new page or update existing page with JSON data."""
+def get_property_formatters(database_properties):
+    """Map each property the database can be written to onto its formatter."""
+    return {
+        name: _FORMATTERS[prop_type]
+        for name, prop_type in database_properties.items()
+        if prop_type in _FORMATTERS
+    }
+
+def build_properties(json_data, database_properties, formatters=None):
+    """Turn AI-generated JSON into a Notion properties payload for the database.
+    
+    Pass the result of get_property_formatters as formatters when building many
+    rows for the same database, so the type dispatch happens once per database.
+    """
+    if formatters is None:
+        formatters = get_property_formatters(database_properties)
+    
     properties = {}
-    skipped_properties = []
+    log_lines = []
+    skipped_lines = []
     
     for key, value in json_data.items():
-        if key in database_properties:
-            prop_type = database_properties[key]
-            formatted_value = format_property_value(value, prop_type)
-            
-            if formatted_value:
-                properties[key] = formatted_value
-                print(f"✅ Will set {key} = '{value}' (type: {prop_type})")
-            else:
-                skipped_properties.append((key, value, f"failed to format for {prop_type}"))
+        prop_type = database_properties.get(key)
+        if prop_type is None:
+            skipped_lines.append(f"   ❌ {key} = '{value}' (property not found in database)")
+            continue
+        
+        formatter = formatters.get(key)
+        if formatter is None:
+            skipped_lines.append(f"   ❌ {key} = '{value}' (unsupported property type {prop_type})")
+            continue
+        
+        formatted_value = formatter(value)
+        if formatted_value:
+            properties[key] = formatted_value
+            log_lines.append(f"✅ Will set {key} = '{value}' (type: {prop_type})")
         else:
-            skipped_properties.append((key, value, "property not found in database"))
+            skipped_lines.append(f"   ❌ {key} = '{value}' (failed to format for {prop_type})")
     
     # Log skipped properties
-    if skipped_properties:
-        print("\n⚠️  Skipped properties:")
-        for key, value, reason in skipped_properties:
-            print(f"   ❌ {key} = '{value}' ({reason})")
+    if skipped_lines:
+        log_lines.append("\n⚠️  Skipped properties:")
+        log_lines.extend(skipped_lines)
+    
+    # One write per row keeps each row's log together and avoids a flush per property
+    if log_lines:
+        print("\n".join(log_lines))
     
+    return properties
+
+def apply_page(database_id, page_id, properties):
+    """Update page_id with properties, or create a new page when page_id is None."""
+    notion = get_notion()
     try:
         if page_id:
             # Update existing page
             print(f"\n🔄 Updating existing page...")
-            notion.pages.update(
+            notion_call(
+                notion.pages.update,
                 page_id=page_id,
                 properties=properties
             )
@@ -282,7 +671,8 @@ def create_or_update_page(database_id, page_id, json_data, database_properties,
         else:
             # Create new page
             print(f"\n📝 Creating new page...")
-            notion.pages.create(
+            notion_call(
+                notion.pages.create,
                 parent={"database_id": database_id},
                 properties=properties
             )
@@ -294,11 +684,146 @@ def create_or_update_page(database_id, page_id, json_data, database_properties,
         print(f"❌ Error {'updating' if page_id else 'creating'} page: {e}")
         return False
 
+def apply_pages_bulk(database_id, rows, max_workers=NOTION_MAX_WORKERS):
+    """Apply many (page_id, properties) rows concurrently; returns one success flag per row."""
+    if len(rows) == 1:
+        return [apply_page(database_id, *rows[0])]
+    
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(rows))) as executor:
+        return list(executor.map(lambda row: apply_page(database_id, *row), rows))
+
+@dataclass
+class Context:
+    """Everything resolved once per database, reused for every row added to it."""
+    database_id: str
+    database_properties: dict
+    key_property: str
+    prompt_id: str
+    prompt_version: str
+    formatters: dict | None = None
+
+def setup_context(database_name, key_property, refresh=False):
+    """Resolve the prompt config and database schema, or return None on failure."""
+    prompt_id, prompt_version = get_custom_prompt_config(database_name)
+    if not prompt_id or not prompt_version:
+        return None
+    
+    # Find the database
+    database_id, database = get_database_by_name(database_name, refresh)
+    if not database_id:
+        return None
+    
+    # Get database properties
+    database_properties = get_database_properties(database)
+    print(f"📋 Database properties found: {list(database_properties.keys())}")
+    
+    # Validate key property exists
+    if key_property not in database_properties:
+        print(f"❌ Key property '{key_property}' not found in database")
+        print(f"   Available properties: {list(database_properties.keys())}")
+        print("   If the property was added recently, re-run with --refresh")
+        return None
+    
+    if database_properties[key_property] not in KEY_PROPERTY_TYPES:
+        print(f"❌ Key property '{key_property}' has unsupported type '{database_properties[key_property]}'")
+        print(f"   Supported key types: {', '.join(sorted(KEY_PROPERTY_TYPES))}")
+        return None
+    
+    return Context(
+        database_id, database_properties, key_property, prompt_id, prompt_version,
+        get_property_formatters(database_properties)
+    )
+
+def write_rows(ctx, responses):
+    """Create or update one page per AI-generated row; returns one success flag per row.
+    
+    A response may be a single JSON object or a JSON array of objects, in which
+    case every object in the array becomes its own row.
+    """
+    items = []
+    for json_data in responses:
+        items.extend(json_data if isinstance(json_data, list) else [json_data])
+    
+    rows = []
+    for json_data in items:
+        if not json_data:
+            continue
+        
+        if not isinstance(json_data, dict):
+            print(f"❌ AI response is not a JSON object: {str(json_data)[:100]}")
+            continue
+        
+        # Validate key property exists in JSON response
+        if ctx.key_property not in json_data:
+            print(f"❌ Key property '{ctx.key_property}' not found in AI response")
+            print(f"   Response keys: {list(json_data.keys())}")
+            continue
+        
+        print(f"🔑 Key value from AI: {json_data[ctx.key_property]}")
+        rows.append(json_data)
+    
+    if not rows:
+        return [False] * max(len(items), 1)
+    
+    # Rows with the same key would all miss the lookup and each create a
+    # page, so keep only the last row generated for every key
+    key_type = ctx.database_properties[ctx.key_property]
+    row_keys = []
+    for json_data in rows:
+        key_value = json_data[ctx.key_property]
+        value = normalize_key_value(key_type, key_value)
+        row_keys.append(str(key_value) if value is None else value)
+    latest = dict(zip(row_keys, rows))
+    if len(latest) < len(rows):
+        print(f"⚠️  Skipped {len(rows) - len(latest)} row(s) whose key is repeated by a later row")
+        rows = list(latest.values())
+    
+    # Check for existing pages with a single lookup for all key values
+    key_values = [json_data[ctx.key_property] for json_data in rows]
+    if len(rows) == 1:
+        existing_page_id = find_existing_page(ctx.database_id, ctx.key_property, key_values[0], key_type)
+        existing = {str(key_values[0]): existing_page_id} if existing_page_id else {}
+    else:
+        print(f"🔍 Searching for existing pages for {len(rows)} key values")
+        try:
+            existing = find_existing_pages(ctx.database_id, ctx.key_property, key_values, key_type)
+        except Exception as e:
+            print(f"❌ Error searching for existing pages: {e}")
+            existing = {}
+        print(f"✅ Found {len(existing)} existing pages")
+    
+    # Create or update pages
+    page_ids = [existing.get(str(key_value)) for key_value in key_values]
+    results = apply_pages_bulk(
+        ctx.database_id,
+        [
+            (page_id, build_properties(json_data, ctx.database_properties, ctx.formatters))
+            for page_id, json_data in zip(page_ids, rows)
+        ]
+    )
+    
+    for page_id, json_data, success in zip(page_ids, rows, results):
+        if success:
+            action = "Updated" if page_id else "Created"
+            print(f"\n🎉 {action} page successfully!" if len(rows) == 1
+                  else f"🎉 {action}: {json_data[ctx.key_property]}")
+    
+    # A skipped duplicate shares the outcome of the row that replaced it
+    outcomes = dict(zip(latest, results))
+    return [outcomes[key] for key in row_keys] + [False] * (len(items) - len(row_keys))
+
 def main():
     parser = argparse.ArgumentParser(description="Add or update Notion database rows using AI-generated JSON")
     parser.add_argument("database_name", help="Name of the Notion database")
     parser.add_argument("key_property", help="Name of the property to use as the key")
-    parser.add_argument("input_text", help="Input text to send to the AI model")
+    parser.add_argument("input_text", nargs="+",
+                       help="Input text to send to the AI model (pass several to add several rows)")
+    parser.add_argument("--refresh", action="store_true",
+                       help="Ignore the cached database schema and look it up again")
+    parser.add_argument("--batch", action="store_true",
+                       help="Generate rows through the OpenAI Batch API (half the cost, but slower)")
+    parser.add_argument("--no-cache", action="store_true",
+                       help="Always ask the AI again instead of reusing a cached response for the same input")
     
     args = parser.parse_args()
     
@@ -312,62 +837,35 @@ def main():
     
     print(f"🎯 Database: {args.database_name}")
     print(f"🔑 Key Property: {args.key_property}")
-    print(f"📝 Input Text: {args.input_text}")
+    for input_text in args.input_text:
+        print(f"📝 Input Text: {input_text}")
     print("")
     
-    # Get custom prompt configuration
-    prompt_id, prompt_version = get_custom_prompt_config(args.database_name)
-    if not prompt_id or not prompt_version:
-        return 1
-    
-    # Find the database
-    database_id, database = get_database_by_name(args.database_name)
-    if not database_id:
-        return 1
-    
-    # Get database properties
-    database_properties = get_database_properties(database)
-    
-    # Validate key property exists
-    if args.key_property not in database_properties:
-        print(f"❌ Key property '{args.key_property}' not found in database")
-        print(f"   Available properties: {list(database_properties.keys())}")
+    # Resolve the schema first (usually from the local cache) so the prompt can list it
+    ctx = setup_context(args.database_name, args.key_property, args.refresh)
+    if not ctx:
         return 1
     
     print("=" * 60)
     
-    # Call OpenAI with custom prompt
-    json_data = call_openai_custom_prompt(prompt_id, prompt_version, args.input_text)
-    if not json_data:
-        return 1
-    
-    # Validate key property exists in JSON response
-    if args.key_property not in json_data:
-        print(f"❌ Key property '{args.key_property}' not found in AI response")
-        print(f"   Response keys: {list(json_data.keys())}")
-        return 1
-    
-    key_value = json_data[args.key_property]
-    print(f"🔑 Key value from AI: {key_value}")
-    
-    # Check for existing page
-    existing_page_id = find_existing_page(database_id, args.key_property, key_value)
-    
-    # Create or update page
-    success = create_or_update_page(
-        database_id, 
-        existing_page_id, 
-        json_data, 
-        database_properties, 
-        args.key_property
-    )
-    
-    if success:
-        action = "Updated" if existing_page_id else "Created"
-        print(f"\n🎉 {action} page successfully!")
-        return 0
+    if args.batch:
+        responses = call_openai_batch(
+            ctx.prompt_id, ctx.prompt_version, args.input_text, ctx.database_properties,
+            use_cache=not args.no_cache
+        )
     else:
-        return 1
+        # Generate all rows concurrently
+        with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(args.input_text))) as executor:
+            responses = list(executor.map(
+                lambda input_text: call_openai_custom_prompt(
+                    ctx.prompt_id, ctx.prompt_version, input_text, ctx.database_properties,
+                    use_cache=not args.no_cache
+                ),
+                args.input_text
+            ))
+    
+    results = write_rows(ctx, responses)
+    return 0 if all(results) else 1
 
 if __name__ == "__main__":
-    sys.exit(main()) 
\ No newline at end of file
+    sys.exit(main())
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Helpers shared by the scripts for creating, pacing and retrying calls to the Notion API
+"""
+
+import time
+import logging
+import threading
+from functools import wraps
+
+log = logging.getLogger(__name__)
+
+def make_notion_client(auth):
+    """Create a Notion client, speaking HTTP/2 when the optional h2 package is installed.
+
+    With HTTP/2 the concurrent requests from worker threads share one
+    connection instead of each opening its own.
+    """
+    import httpx
+    from notion_client import Client as NotionClient
+
+    try:
+        import h2  # noqa: F401  (only needed by httpx for http2=True)
+    except ImportError:
+        return NotionClient(auth=auth)
+    return NotionClient(auth=auth, client=httpx.Client(http2=True))
+
+class TokenBucket:
+    """Thread-safe token bucket: allows `rate` calls per second with bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available, then take it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+# Notion allows an average of 3 requests per second per integration; stay a little under it
+NOTION_LIMITER = TokenBucket(rate=2.5, capacity=3)
+
+# Transient failures worth retrying, and how many attempts a call gets in total
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+MAX_ATTEMPTS = 5
+MAX_BACKOFF = 16
+
+def retry_delay(attempt, retry_after=None):
+    """Seconds to wait before retry number `attempt` (1, 2, 4, ... capped at MAX_BACKOFF).
+
+    A Retry-After header value wins when it asks for a longer wait.
+    """
+    delay = min(MAX_BACKOFF, 2 ** (attempt - 1))
+    try:
+        return max(delay, float(retry_after))
+    except (TypeError, ValueError):
+        return delay
+
+def notion_call(fn, *args, **kwargs):
+    """Call a notion_client method once the shared rate limiter allows it.
+
+    Rate-limit (429), 5xx and timeout errors are retried with exponential
+    backoff, honouring Retry-After; anything else is raised straight away.
+    """
+    from notion_client.errors import HTTPResponseError, RequestTimeoutError
+
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        NOTION_LIMITER.acquire()
+        try:
+            return fn(*args, **kwargs)
+        except (HTTPResponseError, RequestTimeoutError) as e:
+            status = getattr(e, "status", None)
+            if attempt == MAX_ATTEMPTS or (status is not None and status not in RETRY_STATUSES):
+                raise
+            delay = retry_delay(attempt, getattr(e, "headers", {}).get("Retry-After"))
+            log.warning(f"⏳ Notion request failed ({status or 'timeout'}), retrying in {delay:.0f}s...")
+            time.sleep(delay)
+
+def rate_limited(fn):
+    """Wrap a notion_client method so every call goes through notion_call.
+
+    Useful with iterate_paginated_api, which calls the method once per page.
+    """
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        return notion_call(fn, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Small SQLite-backed cache shared by the Notion enhancement scripts
+"""
+
+import os
+import json
+import time
+import hashlib
+import sqlite3
+from contextlib import closing
+
+CACHE_PATH = os.path.expanduser("~/.cache/movie-bot/cache.db")
+
+def make_key(*parts):
+    """Build a stable cache key from any JSON-serializable parts"""
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+class CacheStore:
+    """Key/value store with per-entry expiry, persisted in a single SQLite file.
+
+    Every operation opens its own short-lived connection so the store can be
+    used from worker threads. Cache failures are never fatal: reads fall back
+    to a miss and writes are skipped.
+    """
+
+    def __init__(self, namespace, path=CACHE_PATH):
+        self.namespace = namespace
+        self.path = path
+        self._ready = False
+
+    def _connect(self):
+        if not self._ready:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=5)
+        if not self._ready:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "namespace TEXT NOT NULL, "
+                "key TEXT NOT NULL, "
+                "value TEXT NOT NULL, "
+                "fetched_at INTEGER NOT NULL, "
+                "expires_at INTEGER, "
+                "PRIMARY KEY (namespace, key))"
+            )
+            self._ready = True
+        return conn
+
+    def get(self, key):
+        """Return the cached value for key, or None if missing or expired"""
+        try:
+            with closing(self._connect()) as conn:
+                row = conn.execute(
+                    "SELECT value FROM cache WHERE namespace = ? AND key = ? "
+                    "AND (expires_at IS NULL OR expires_at > ?)",
+                    (self.namespace, key, int(time.time()))
+                ).fetchone()
+        except (sqlite3.Error, OSError):
+            return None
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, value, expire=None):
+        """Store a JSON-serializable value, optionally expiring after `expire` seconds"""
+        now = int(time.time())
+        expires_at = now + int(expire) if expire else None
+        try:
+            with closing(self._connect()) as conn, conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache (namespace, key, value, fetched_at, expires_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (self.namespace, key, json.dumps(value), now, expires_at)
+                )
+        except (sqlite3.Error, OSError):
+            pass
+
+    def delete(self, key):
+        """Remove a single entry from the cache"""
+        try:
+            with closing(self._connect()) as conn, conn:
+                conn.execute(
+                    "DELETE FROM cache WHERE namespace = ? AND key = ?",
+                    (self.namespace, key)
+                )
+        except (sqlite3.Error, OSError):
+            pass
@@ -1,173 +1,266 @@
-import os, requests
-from notion_client import Client as NotionClient
+import os, sys, argparse, logging, threading, requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
+from notion_client.helpers import iterate_paginated_api
 from dotenv import load_dotenv
+from cache_store import CacheStore, make_key
+from api_utils import TokenBucket, make_notion_client, notion_call, rate_limited
+
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    # orjson is optional; the standard library gives the same result, just slower
+    from json import loads as json_loads
+
 load_dotenv()
 
 TMDB_KEY   = os.getenv("TMDB_KEY")
 NOTION_KEY = os.getenv("NOTION_KEY")
 DB_ID      = os.getenv("NOTION_DB")
 
-notion = NotionClient(auth=NOTION_KEY)
+notion = make_notion_client(NOTION_KEY)
 TMDB_BASE = "https://api.themoviedb.org/3"
 
-def get_poster_url(title, year=None):
-    print(f"🔍 Searching for poster: {title}" + (f" ({year})" if year else ""))
+# Per-movie progress goes through this logger so --quiet can drop it
+log = logging.getLogger(__name__)
+
+# (connect, read) timeouts in seconds so a dead endpoint can't hang the run
+REQUEST_TIMEOUT = (3.05, 30)
+
+# Movies are processed a few at a time; Notion allows about 3 requests per
+# second per integration, so going much wider only trades waiting for 429s
+MAX_WORKERS = 4
+
+# At most this many fetched rows wait for or occupy a worker at any time
+PENDING_SLOTS = threading.BoundedSemaphore(MAX_WORKERS * 2)
+
+# One keep-alive session for all TMDb requests, with a socket per worker thread.
+# Rate limits and server errors are retried with exponential backoff (1, 2, 4, 8s),
+# waiting longer when TMDb sends a Retry-After header
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=MAX_WORKERS,
+    max_retries=Retry(total=4, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504])
+))
+
+# TMDb allows roughly 40 requests per 10 seconds per IP; pace the workers so
+# bursts never run into 429s and the retries they cost
+TMDB_LIMITER = TokenBucket(rate=4, capacity=40)
+
+# TMDb metadata for released movies practically never changes, so keep it for a month
+TMDB_CACHE = CacheStore("tmdb")
+TMDB_CACHE_TTL = 30 * 24 * 60 * 60
+
+# Properties this script fills in, when the database has them with this type
+ENRICHED_PROPERTIES = {
+    "Poster": "files",
+    "Runtime": "number",
+    "Synopsis": "rich_text",
+    "Year": "number",
+}
+
+# Notion filter matching a row whose property is still empty, by property
+EMPTY_FILTERS = {name: {prop_type: {"is_empty": True}} for name, prop_type in ENRICHED_PROPERTIES.items()}
+
+# The only fields read from TMDb search results and movie details
+SEARCH_FIELDS = ("id", "poster_path", "release_date")
+DETAILS_FIELDS = ("id", "runtime", "overview")
+
+def search_movie(title, year=None):
+    """Return TMDb's best search match for the movie, or None if nothing matched.
+    
+    Matches are cached on disk by (title, year); misses are not, so a movie that
+    TMDb adds later is still picked up on the next run.
+    """
+    cache_key = make_key("search/movie", title, year)
+    cached = TMDB_CACHE.get(cache_key)
+    if cached:
+        return cached
+    
     params = {"api_key": TMDB_KEY, "query": title}
     if year:
         params["year"] = year
     
-    q = f"{TMDB_BASE}/search/movie"
-    res = requests.get(q, params=params).json()["results"]
+    TMDB_LIMITER.acquire()
+    response = SESSION.get(f"{TMDB_BASE}/search/movie", params=params, timeout=REQUEST_TIMEOUT)
+    res = json_loads(response.content).get("results", [])
     if not res:
-        print(f"❌ No poster found for {title}" + (f" ({year})" if year else ""))
+        return None
+    
+    # Only keep the fields we read, so cached matches stay small
+    match = {key: res[0].get(key) for key in SEARCH_FIELDS}
+    TMDB_CACHE.set(cache_key, match, expire=TMDB_CACHE_TTL)
+    return match
+
+def get_movie_details(tmdb_id):
+    """Return the runtime and overview TMDb has for a movie, cached on disk."""
+    cache_key = make_key("movie", tmdb_id)
+    cached = TMDB_CACHE.get(cache_key)
+    if cached:
+        return cached
+    
+    TMDB_LIMITER.acquire()
+    response = SESSION.get(
+        f"{TMDB_BASE}/movie/{tmdb_id}",
+        params={"api_key": TMDB_KEY},
+        timeout=REQUEST_TIMEOUT
+    )
+    details = json_loads(response.content)
+    
+    # Only keep what we use, and don't cache error bodies (they have no id)
+    details = {key: details.get(key) for key in DETAILS_FIELDS}
+    if details["id"] is not None:
+        TMDB_CACHE.set(cache_key, details, expire=TMDB_CACHE_TTL)
+    return details
+
+def release_year(match):
+    """Pull the release year out of a TMDb search result."""
+    found_year = match.get("release_date", "")[:4] if match.get("release_date") else None
+    return int(found_year) if found_year and found_year.isdigit() else None
+
+def get_poster_url(title, year=None, match=None):
+    """Return the poster URL and release year; pass match to reuse an earlier search."""
+    log.info(f"🔍 Searching for poster: {title}" + (f" ({year})" if year else ""))
+    if match is None:
+        match = search_movie(title, year)
+    
+    if not match or not match.get("poster_path"):
+        log.error(f"❌ No poster found for {title}" + (f" ({year})" if year else ""))
         return None, None
     
-    path = res[0]["poster_path"]
+    path = match["poster_path"]
     url = f"https://image.tmdb.org/t/p/w500{path}"
-    found_year = res[0].get("release_date", "")[:4] if res[0].get("release_date") else None
-    found_year = int(found_year) if found_year and found_year.isdigit() else None
+    found_year = release_year(match)
     
-    print(f"📸 Found poster for {title}: {url}")
+    log.info(f"📸 Found poster for {title}: {url}")
     if found_year:
-        print(f"📅 Found year for {title}: {found_year}")
+        log.info(f"📅 Found year for {title}: {found_year}")
     
     return url, found_year
 
-def update_row(page_id, title, url):
-    print(f"🔄 Updating poster for {title}...")
-    notion.pages.update(
-        page_id=page_id,
-        properties={
-            "Poster": {
-                "files": [
-                    {
-                        "name": f"{title} poster",       # ← required!
-                        "type": "external",
-                        "external": {"url": url}
-                    }
-                ]
+def format_poster(title, url):
+    """Build the Poster property value pointing at an external image URL."""
+    return {
+        "files": [
+            {
+                "name": f"{title} poster",       # ← required!
+                "type": "external",
+                "external": {"url": url}
             }
-        }
-    )
-    print(f"✅ Poster updated for {title}")
+        ]
+    }
 
-def fetch_movie_details(title: str, year: int = None) -> tuple[int | None, str | None, int | None]:
-    """Return the movie runtime, synopsis, and year, or None if not found."""
-    print(f"🎬 Searching for movie details: {title}" + (f" ({year})" if year else ""))
+def fetch_movie_details(title: str, year: int = None, match: dict = None,
+                        include_details: bool = True) -> tuple[int | None, str | None, int | None]:
+    """Return the movie runtime, synopsis, and year, or None if not found.
     
-    # 1) Search for the movie on TMDb
-    params = {"api_key": TMDB_KEY, "query": title}
-    if year:
-        params["year"] = year
-        
-    resp = requests.get(
-        f"{TMDB_BASE}/search/movie",
-        params=params
-    ).json().get("results", [])
+    Pass match to reuse an earlier search result. With include_details=False only
+    the year is looked up, which the search result already has, so the details
+    request is skipped.
+    """
+    log.info(f"🎬 Searching for movie details: {title}" + (f" ({year})" if year else ""))
     
-    if not resp:
-        print(f"❌ No movie found for details search: {title}" + (f" ({year})" if year else ""))
+    # 1) Search for the movie on TMDb, unless the caller already did
+    if match is None:
+        match = search_movie(title, year)
+    
+    if not match:
+        log.error(f"❌ No movie found for details search: {title}" + (f" ({year})" if year else ""))
         return None, None, None
 
-    tmdb_id = resp[0]["id"]
-    found_year = resp[0].get("release_date", "")[:4] if resp[0].get("release_date") else None
-    found_year = int(found_year) if found_year and found_year.isdigit() else None
+    tmdb_id = match["id"]
+    found_year = release_year(match)
     
-    print(f"🎬 Found movie ID {tmdb_id} for {title}")
+    log.info(f"🎬 Found movie ID {tmdb_id} for {title}")
     if found_year:
-        print(f"📅 Found year for {title}: {found_year}")
+        log.info(f"📅 Found year for {title}: {found_year}")
+    
+    if not include_details:
+        return None, None, found_year
     
     # 2) Fetch full movie details
-    details = requests.get(
-        f"{TMDB_BASE}/movie/{tmdb_id}",
-        params={"api_key": TMDB_KEY}
-    ).json()
+    details = get_movie_details(tmdb_id)
     
     runtime = details.get("runtime")
     synopsis = details.get("overview")
     
     if runtime:
-        print(f"⏱️  Runtime found for {title}: {runtime} minutes")
+        log.info(f"⏱️  Runtime found for {title}: {runtime} minutes")
     else:
-        print(f"⚠️  No runtime data available for {title}")
+        log.warning(f"⚠️  No runtime data available for {title}")
         
     if synopsis:
-        print(f"📝 Synopsis found for {title}: {synopsis[:100]}...")
+        log.info(f"📝 Synopsis found for {title}: {synopsis[:100]}...")
     else:
-        print(f"⚠️  No synopsis available for {title}")
+        log.warning(f"⚠️  No synopsis available for {title}")
         
     return runtime, synopsis, found_year
 
-# 1. Read the DB
-print("📚 Fetching movies from Notion database...")
-rows = notion.databases.query(database_id=DB_ID).get("results")
-print(f"📋 Found {len(rows)} movies to process")
-print("=" * 50)
-
-# 2. Loop through each movie
-for i, row in enumerate(rows, 1):
-    title = row["properties"]["Name"]["title"][0]["plain_text"]
+def process_row(i, row, schema):
+    """Fill in the poster, runtime, synopsis and year for one movie row.
     
-    # Handle missing or None year
-    year_property = row["properties"].get("Year", {})
-    year = year_property.get("number") if year_property else None
+    schema is the set of ENRICHED_PROPERTIES the database has; the others are
+    neither read nor written.
+    """
+    props = row["properties"]
+    title = props["Name"]["title"][0]["plain_text"]
+    year = props["Year"]["number"] if "Year" in schema else None
     
     page_id = row["id"]
     
-    print(f"\n🎬 Processing movie {i}/{len(rows)}: {title}" + (f" ({year})" if year else " (no year)"))
-    print("-" * 40)
-    
-    # Check if poster already exists
-    poster_property = row["properties"].get("Poster", {})
-    poster_files = poster_property.get("files", [])
-    has_poster = len(poster_files) > 0
+    log.info(f"\n🎬 Processing movie {i}: {title}" + (f" ({year})" if year else " (no year)"))
+    log.info("-" * 40)
     
     found_year = year  # Initialize with existing year
     
+    # Check which properties still need filling in
+    has_poster = "Poster" not in schema or len(props["Poster"]["files"]) > 0
+    need_runtime = "Runtime" in schema and props["Runtime"]["number"] is None
+    need_synopsis = "Synopsis" in schema and not props["Synopsis"]["rich_text"]
+    need_year = "Year" in schema and year is None
+    
+    # Complete rows need no TMDb or Notion calls at all
+    if has_poster and not (need_runtime or need_synopsis or need_year):
+        log.info(f"✅ {title} already has a poster, runtime, synopsis and year - skipping")
+        return
+    
+    # One TMDb search serves both the poster and the details lookups
+    match = search_movie(title, year)
+    
+    # Every change for the row is collected here and sent in a single update
+    update_properties = {}
+    
     if has_poster:
-        print(f"📸 Poster already exists for {title} - skipping poster update")
+        log.info(f"📸 Poster already exists for {title} - skipping poster update")
     else:
         # Process poster
-        url, poster_year = get_poster_url(title, year)
+        url, poster_year = get_poster_url(title, year, match)
         if url:
-            update_row(page_id, title, url)
+            update_properties["Poster"] = format_poster(title, url)
+            log.info(f"🔄 Updating poster for {title}...")
             if poster_year and not found_year:
                 found_year = poster_year
         else:
-            print(f"⚠️  Skipping poster update for {title} - no poster found")
-
-    # Check if runtime already exists
-    runtime_property = row["properties"].get("Runtime", {})
-    existing_runtime = runtime_property.get("number")
-    
-    # Check if synopsis already exists
-    synopsis_property = row["properties"].get("Synopsis", {})
-    existing_synopsis = synopsis_property.get("rich_text", [])
-    has_synopsis = len(existing_synopsis) > 0
-    
-    # Check if we need to fetch details (runtime, synopsis, or year)
-    need_runtime = existing_runtime is None
-    need_synopsis = not has_synopsis
-    need_year = year is None
+            log.warning(f"⚠️  Skipping poster update for {title} - no poster found")
     
+    runtime = synopsis = None
     if not need_runtime and not need_synopsis and not need_year:
-        print(f"⏱️  Runtime already exists for {title}: {existing_runtime} min")
-        print(f"📝 Synopsis already exists for {title}")
-        print(f"📅 Year already exists for {title}: {year}")
+        log.info(f"⏱️  Runtime, synopsis and year already exist for {title}")
     else:
-        # Fetch runtime, synopsis, and potentially year in one API call
-        runtime, synopsis, details_year = fetch_movie_details(title, year)
+        # Fetch runtime and synopsis; the year comes from the search result
+        runtime, synopsis, details_year = fetch_movie_details(
+            title, year, match, include_details=need_runtime or need_synopsis
+        )
         
         # Use the found year if we don't have one yet
         if details_year and not found_year:
             found_year = details_year
         
-        # Update properties that need updating
-        update_properties = {}
-        
         if runtime is not None and need_runtime:
             update_properties["Runtime"] = {"number": runtime}
-            print(f"🔄 Updating runtime for {title}...")
+            log.info(f"🔄 Updating runtime for {title}...")
             
         if synopsis and need_synopsis:
             update_properties["Synopsis"] = {
@@ -178,29 +271,107 @@ for i, row in enumerate(rows, 1):
                     }
                 ]
             }
-            print(f"🔄 Updating synopsis for {title}...")
+            log.info(f"🔄 Updating synopsis for {title}...")
         
         if found_year and need_year:
             update_properties["Year"] = {"number": found_year}
-            print(f"🔄 Updating year for {title}...")
+            log.info(f"🔄 Updating year for {title}...")
+    
+    # Update Notion if we have properties to update
+    if update_properties:
+        notion_call(
+            notion.pages.update,
+            page_id=page_id,
+            properties=update_properties
+        )
         
-        # Update Notion if we have properties to update
-        if update_properties:
-            notion.pages.update(
-                page_id=page_id,
-                properties=update_properties
-            )
-            
-            if runtime is not None and need_runtime:
-                print(f"✅ Runtime updated for {title}: {runtime} min")
-            if synopsis and need_synopsis:
-                print(f"✅ Synopsis updated for {title}")
-            if found_year and need_year:
-                print(f"✅ Year updated for {title}: {found_year}")
-        else:
-            print(f"⚠️  No new details to update for {title}")
+        if "Poster" in update_properties:
+            log.info(f"✅ Poster updated for {title}")
+        if "Runtime" in update_properties:
+            log.info(f"✅ Runtime updated for {title}: {runtime} min")
+        if "Synopsis" in update_properties:
+            log.info(f"✅ Synopsis updated for {title}")
+        if "Year" in update_properties:
+            log.info(f"✅ Year updated for {title}: {found_year}")
+    elif need_runtime or need_synopsis or need_year:
+        log.warning(f"⚠️  No new details to update for {title}")
+    
+    log.info(f"✅ Completed processing: {title}")
+
+def safe_process_row(i, row, schema):
+    """Process one row, reporting errors instead of stopping the other rows."""
+    try:
+        process_row(i, row, schema)
+        return True
+    except Exception as e:
+        log.error(f"❌ Error processing movie {i} ({row.get('id')}): {e}")
+        return False
+
+def get_schema():
+    """Return which of ENRICHED_PROPERTIES exist in the database with the expected type, checked once per run."""
+    properties = notion_call(notion.databases.retrieve, database_id=DB_ID)["properties"]
+    schema = frozenset(
+        name for name, prop_type in ENRICHED_PROPERTIES.items()
+        if properties.get(name, {}).get("type") == prop_type
+    )
+    for name, prop_type in ENRICHED_PROPERTIES.items():
+        if name not in properties:
+            print(f"⚠️  Database has no '{name}' property - it won't be filled in")
+        elif name not in schema:
+            print(f"⚠️  '{name}' is a {properties[name]['type']} property, not {prop_type} - it won't be filled in")
+    return schema
+
+def iter_rows(schema):
+    """Yield every movie still missing one of the schema's properties.
+    
+    Complete rows are filtered out by Notion, so they are never downloaded;
+    the next page is only fetched when needed.
+    """
+    conditions = [{"property": name, **EMPTY_FILTERS[name]} for name in ENRICHED_PROPERTIES if name in schema]
+    if not conditions:
+        return iter(())
+    return iterate_paginated_api(
+        rate_limited(notion.databases.query),
+        database_id=DB_ID,
+        filter={"or": conditions},
+        page_size=100
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill in posters, runtimes, synopses and years for a Notion movie database")
+    parser.add_argument("--quiet", action="store_true",
+                        help="Only print warnings, errors and the final summary instead of per-movie progress")
+    args = parser.parse_args()
+    logging.basicConfig(stream=sys.stdout, format="%(message)s",
+                        level=logging.WARNING if args.quiet else logging.INFO)
+    
+    # 1. Read the DB
+    print("📚 Fetching movies from Notion database...")
+    schema = get_schema()
+    print("=" * 50)
+    
+    # 2. Process the movies; each row only waits on its own TMDb and Notion calls.
+    # Rows are handed to the pool as each page arrives, so later pages are fetched
+    # while the first rows are already being processed, and only a bounded number
+    # of rows are held in memory at once
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = []
+        for i, row in enumerate(iter_rows(schema), 1):
+            # Wait for a free slot so unprocessed rows don't pile up in the queue
+            PENDING_SLOTS.acquire()
+            future = executor.submit(safe_process_row, i, row, schema)
+            future.add_done_callback(lambda _: PENDING_SLOTS.release())
+            futures.append(future)
+        print(f"📋 Found {len(futures)} movies to process")
+        results = [future.result() for future in futures]
     
-    print(f"✅ Completed processing: {title}")
+    print("\n" + "=" * 50)
+    failed = results.count(False)
+    if failed:
+        print(f"⚠️  Finished with {failed} of {len(results)} movies failing")
+        return 1
+    print("🎉 All movies processed!")
+    return 0
 
-print("\n" + "=" * 50)
-print("🎉 All movies processed!")
\ No newline at end of file
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,28 +2,83 @@ import os
 import sys
 import requests
 import argparse
-from notion_client import Client as NotionClient
+import logging
+import threading
+from contextlib import nullcontext
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from notion_client.errors import APIResponseError
+from notion_client.helpers import iterate_paginated_api
 from dotenv import load_dotenv
+from api_utils import make_notion_client, notion_call, rate_limited
+from cache_store import CacheStore, make_key
+
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    # orjson is optional; the standard library gives the same result, just slower
+    from json import loads as json_loads
 
 load_dotenv()
 
 NOTION_KEY = os.getenv("NOTION_KEY")
 UNSPLASH_ACCESS_KEY = os.getenv("UNSPLASH_ACCESS_KEY")
 
-notion = NotionClient(auth=NOTION_KEY)
+notion = make_notion_client(NOTION_KEY)
+
+# Per-page progress goes through this logger so --quiet can drop it
+log = logging.getLogger(__name__)
+
+# (connect, read) timeouts in seconds so a dead endpoint can't hang the run
+REQUEST_TIMEOUT = (3.05, 30)
+
+# Pages are processed a few at a time; Notion allows about 3 requests per
+# second per integration, so going much wider only trades waiting for 429s
+MAX_WORKERS = 4
+
+# At most this many fetched pages wait for or occupy a worker at any time
+PENDING_SLOTS = threading.BoundedSemaphore(MAX_WORKERS * 2)
+
+# Held around each Notion write with --concurrency-mode serial
+WRITE_LOCK = threading.Lock()
 
-def search_image(query):
-    """Search for an image using Unsplash API."""
-    print(f"🔍 Searching for image: {query}")
+# One keep-alive session for all Unsplash requests, with a socket per worker
+# thread, so each search after the first skips the TCP/TLS handshake. Rate
+# limits and server errors are retried with exponential backoff
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(
+    pool_maxsize=MAX_WORKERS,
+    max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+))
+SESSION.headers["Authorization"] = f"Client-ID {UNSPLASH_ACCESS_KEY}"
+
+# Database IDs found by name, so later runs skip the search
+DATABASE_CACHE = CacheStore("notion_database_id")
+DATABASE_CACHE_TTL = 30 * 24 * 60 * 60
+
+# Pages with the same input text share one search, in this run and the next ones
+IMAGE_CACHE = CacheStore("unsplash")
+IMAGE_CACHE_TTL = 30 * 24 * 60 * 60
+
+def search_image(query, use_cache=True):
+    """Search for an image using Unsplash API.
+    
+    Found images are cached on disk by the normalized query; misses are not.
+    """
+    log.info(f"🔍 Searching for image: {query}")
     
     if not UNSPLASH_ACCESS_KEY:
-        print("⚠️  UNSPLASH_ACCESS_KEY not found in environment variables")
-        print("   Please sign up at https://unsplash.com/developers and add your access key to .env")
+        log.warning("⚠️  UNSPLASH_ACCESS_KEY not found in environment variables")
+        log.warning("   Please sign up at https://unsplash.com/developers and add your access key to .env")
         return None
     
-    headers = {
-        "Authorization": f"Client-ID {UNSPLASH_ACCESS_KEY}"
-    }
+    cache_key = make_key("search/photos", query.strip().lower())
+    cached = IMAGE_CACHE.get(cache_key) if use_cache else None
+    if cached:
+        log.info(f"📸 Reusing image by {cached['photographer']}: {cached['url']}")
+        return cached
     
     params = {
         "query": query,
@@ -32,42 +87,62 @@ def search_image(query):
     }
     
     try:
-        response = requests.get(
+        response = SESSION.get(
             "https://api.unsplash.com/search/photos",
-            headers=headers,
-            params=params
+            params=params,
+            timeout=REQUEST_TIMEOUT
         )
         response.raise_for_status()
         
-        data = response.json()
+        data = json_loads(response.content)
         results = data.get("results", [])
         
         if not results:
-            print(f"❌ No images found for: {query}")
+            log.error(f"❌ No images found for: {query}")
             return None
         
         image_url = results[0]["urls"]["regular"]
         photographer = results[0]["user"]["name"]
         photo_link = results[0]["links"]["html"]
         
-        print(f"📸 Found image by {photographer}: {image_url}")
-        return {
+        log.info(f"📸 Found image by {photographer}: {image_url}")
+        image_data = {
             "url": image_url,
             "photographer": photographer,
             "source_link": photo_link
         }
+        IMAGE_CACHE.set(cache_key, image_data, expire=IMAGE_CACHE_TTL)
+        return image_data
         
-    except requests.exceptions.RequestException as e:
-        print(f"❌ Error searching for image: {e}")
+    except (requests.exceptions.RequestException, ValueError) as e:
+        log.error(f"❌ Error searching for image: {e}")
         return None
 
 def get_database_by_name(database_name):
     """Find a database by its title/name."""
+    target = database_name.casefold()
+    
+    # Reuse the ID found on an earlier run; one retrieve confirms it still
+    # exists and is shared, which is much cheaper than searching again
+    cache_key = make_key(NOTION_KEY, target)
+    cached_id = DATABASE_CACHE.get(cache_key)
+    if cached_id:
+        try:
+            notion_call(notion.databases.retrieve, database_id=cached_id)
+            print(f"⚡ Using cached database: {database_name} (ID: {cached_id})")
+            return cached_id
+        except Exception as e:
+            # Only a rejection says the ID is stale; after a timeout or a
+            # 5xx keep the entry and fall back to searching for this run
+            if isinstance(e, APIResponseError) and e.status in (403, 404):
+                DATABASE_CACHE.delete(cache_key)
+    
     print(f"🔍 Searching for database: {database_name}")
     
     try:
         # Search for databases
-        response = notion.search(
+        response = notion_call(
+            notion.search,
             query=database_name,
             filter={"property": "object", "value": "database"}
         )
@@ -78,8 +153,9 @@ def get_database_by_name(database_name):
             title_property = db.get("title", [])
             if title_property:
                 db_title = title_property[0].get("plain_text", "")
-                if db_title.lower() == database_name.lower():
+                if db_title.casefold() == target:
                     print(f"✅ Found database: {db_title} (ID: {db['id']})")
+                    DATABASE_CACHE.set(cache_key, db["id"], expire=DATABASE_CACHE_TTL)
                     return db["id"]
         
         print(f"❌ Database not found: {database_name}")
@@ -97,10 +173,11 @@ def get_database_by_name(database_name):
 
 def update_page_with_image(page_id, output_property, image_data, page_title):
     """Update a Notion page with an image in the specified property."""
-    print(f"🔄 Updating {output_property} for: {page_title}")
+    log.info(f"🔄 Updating {output_property} for: {page_title}")
     
     try:
-        notion.pages.update(
+        notion_call(
+            notion.pages.update,
             page_id=page_id,
             properties={
                 output_property: {
@@ -114,47 +191,102 @@ def update_page_with_image(page_id, output_property, image_data, page_title):
                 }
             }
         )
-        print(f"✅ Image updated for: {page_title}")
+        log.info(f"✅ Image updated for: {page_title}")
         return True
         
     except Exception as e:
-        print(f"❌ Error updating page {page_title}: {e}")
+        log.error(f"❌ Error updating page {page_title}: {e}")
         return False
 
+def _first_plain_text(items):
+    return items[0].get("plain_text", "") if items else None
+
+def _formula_value(prop):
+    """Extract a formula (Function) property's result as text."""
+    formula_data = prop.get("formula", {})
+    formula_type = formula_data.get("type")
+    
+    if formula_type == "string":
+        return formula_data.get("string", "")
+    if formula_type in ("number", "boolean"):
+        value = formula_data.get(formula_type)
+        return str(value) if value is not None else ""
+    if formula_type == "date":
+        date_data = formula_data.get("date", {})
+        if date_data:
+            return date_data.get("start", "")
+    return None
+
+# Text extractor for each supported property type, looked up once per property
+_EXTRACTORS = {
+    "title": lambda prop: _first_plain_text(prop.get("title")),
+    "rich_text": lambda prop: _first_plain_text(prop.get("rich_text")),
+    "plain_text": lambda prop: prop.get("plain_text", ""),
+    "formula": _formula_value,
+}
+
 def get_property_value(page_properties, property_name):
     """Extract text value from a Notion property."""
     prop = page_properties.get(property_name, {})
-    prop_type = prop.get("type")
+    extract = _EXTRACTORS.get(prop.get("type"))
+    return extract(prop) if extract else None
+
+def get_page_title(properties):
+    """Return the plain text of the page's title property, or "Untitled"."""
+    title_prop = next((prop for prop in properties.values() if prop.get("type") == "title"), None)
+    return (title_prop and _first_plain_text(title_prop.get("title"))) or "Untitled"
+
+def iter_pages(database_id, page_filter=None):
+    """Yield every page in the database, following the cursor 100 pages at a time.
     
-    if prop_type == "title":
-        title_list = prop.get("title", [])
-        if title_list:
-            return title_list[0].get("plain_text", "")
-    elif prop_type == "rich_text":
-        rich_text_list = prop.get("rich_text", [])
-        if rich_text_list:
-            return rich_text_list[0].get("plain_text", "")
-    elif prop_type == "plain_text":
-        return prop.get("plain_text", "")
-    elif prop_type == "formula":
-        # Handle formula (Function) properties
-        formula_data = prop.get("formula", {})
-        formula_type = formula_data.get("type")
-        
-        if formula_type == "string":
-            return formula_data.get("string", "")
-        elif formula_type == "number":
-            number_val = formula_data.get("number")
-            return str(number_val) if number_val is not None else ""
-        elif formula_type == "boolean":
-            boolean_val = formula_data.get("boolean")
-            return str(boolean_val) if boolean_val is not None else ""
-        elif formula_type == "date":
-            date_data = formula_data.get("date", {})
-            if date_data:
-                return date_data.get("start", "")
+    The next batch is only fetched once the previous one has been consumed.
+    """
+    query = {"database_id": database_id, "page_size": 100}
+    if page_filter:
+        query["filter"] = page_filter
+    return iterate_paginated_api(rate_limited(notion.databases.query), **query)
+
+def process_page(i, page, args):
+    """Find and attach an image for one page; returns "processed", "skipped" or "error"."""
+    properties = page["properties"]
+    page_id = page["id"]
     
-    return None
+    # Get page title for display
+    page_title = get_page_title(properties)
+    
+    log.info(f"\n🔄 Processing page {i}: {page_title}")
+    log.info("-" * 40)
+    
+    # Check if output property already has images (if skip-existing is enabled)
+    if args.skip_existing:
+        output_prop = properties.get(args.output_property, {})
+        existing_files = output_prop.get("files", [])
+        if existing_files:
+            log.info(f"⏭️  Skipping {page_title} - already has images in {args.output_property}")
+            return "skipped"
+    
+    # Get input property value
+    input_value = get_property_value(properties, args.input_property)
+    
+    if not input_value:
+        log.warning(f"⚠️  No text found in {args.input_property} for: {page_title}")
+        return "skipped"
+    
+    log.info(f"📝 Input text: {input_value}")
+    
+    # Search for image
+    image_data = search_image(input_value, use_cache=not args.no_cache)
+    
+    if not image_data:
+        log.warning(f"⚠️  No image found for: {page_title}")
+        return "error"
+    
+    # Update page with image; in serial mode writes take turns so no two land at once
+    with WRITE_LOCK if args.concurrency_mode == "serial" else nullcontext():
+        updated = update_page_with_image(page_id, args.output_property, image_data, page_title)
+    if updated:
+        return "processed"
+    return "error"
 
 def main():
     parser = argparse.ArgumentParser(description="Enrich Notion database pages with images")
@@ -163,8 +295,17 @@ def main():
     parser.add_argument("output_property", help="Name of the output property (files)")
     parser.add_argument("--skip-existing", action="store_true", 
                        help="Skip pages that already have images in the output property")
+    parser.add_argument("--concurrency-mode", choices=["serial", "parallel"], default="serial",
+                       help="Write Notion updates one at a time (serial, default) or from every worker (parallel); "
+                            "lookups run in parallel either way")
+    parser.add_argument("--no-cache", action="store_true",
+                       help="Search Unsplash again instead of reusing images found for the same text")
+    parser.add_argument("--quiet", action="store_true",
+                       help="Only print warnings, errors and the final summary instead of per-page progress")
     
     args = parser.parse_args()
+    logging.basicConfig(stream=sys.stdout, format="%(message)s",
+                        level=logging.WARNING if args.quiet else logging.INFO)
     
     if not NOTION_KEY:
         print("❌ NOTION_KEY not found in environment variables")
@@ -176,75 +317,38 @@ def main():
     if not database_id:
         return 1
     
-    # Query the database
-    print(f"📚 Fetching pages from database: {args.database_name}")
-    try:
-        response = notion.databases.query(database_id=database_id)
-        pages = response.get("results", [])
-        print(f"📋 Found {len(pages)} pages to process")
-    except Exception as e:
-        print(f"❌ Error querying database: {e}")
-        return 1
-    
-    if not pages:
-        print("⚠️  No pages found in database")
-        return 0
+    # Let Notion leave out pages that already have a value
+    page_filter = None
+    if args.skip_existing:
+        page_filter = {"property": args.output_property, "files": {"is_empty": True}}
     
+    # Process the pages a few at a time; each one only waits on its own
+    # Unsplash search and Notion update. Pages are handed to the pool as they
+    # stream in, so only a bounded number are held in memory at once
+    print(f"📚 Fetching pages from database: {args.database_name}")
     print("=" * 60)
-    
-    # Process each page
-    processed = 0
-    skipped = 0
-    errors = 0
-    
-    for i, page in enumerate(pages, 1):
-        properties = page["properties"]
-        page_id = page["id"]
-        
-        # Get page title for display
-        page_title = "Untitled"
-        for prop_name, prop_data in properties.items():
-            if prop_data.get("type") == "title":
-                title_list = prop_data.get("title", [])
-                if title_list:
-                    page_title = title_list[0].get("plain_text", "Untitled")
-                break
-        
-        print(f"\n🔄 Processing page {i}/{len(pages)}: {page_title}")
-        print("-" * 40)
-        
-        # Check if output property already has images (if skip-existing is enabled)
-        if args.skip_existing:
-            output_prop = properties.get(args.output_property, {})
-            existing_files = output_prop.get("files", [])
-            if existing_files:
-                print(f"⏭️  Skipping {page_title} - already has images in {args.output_property}")
-                skipped += 1
-                continue
-        
-        # Get input property value
-        input_value = get_property_value(properties, args.input_property)
-        
-        if not input_value:
-            print(f"⚠️  No text found in {args.input_property} for: {page_title}")
-            skipped += 1
-            continue
-        
-        print(f"📝 Input text: {input_value}")
-        
-        # Search for image
-        image_data = search_image(input_value)
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = []
+        try:
+            for i, page in enumerate(iter_pages(database_id, page_filter), 1):
+                # Wait for a free slot so unprocessed pages don't pile up in the queue
+                PENDING_SLOTS.acquire()
+                future = executor.submit(process_page, i, page, args)
+                future.add_done_callback(lambda _: PENDING_SLOTS.release())
+                futures.append(future)
+        except Exception as e:
+            print(f"❌ Error querying database: {e}")
+            return 1
         
-        if not image_data:
-            print(f"⚠️  No image found for: {page_title}")
-            errors += 1
-            continue
+        if not futures:
+            print("⚠️  No pages found in database")
+            return 0
         
-        # Update page with image
-        if update_page_with_image(page_id, args.output_property, image_data, page_title):
-            processed += 1
-        else:
-            errors += 1
+        print(f"📋 Found {len(futures)} pages to process")
+        results = Counter(future.result() for future in futures)
+    processed = results["processed"]
+    skipped = results["skipped"]
+    errors = results["error"]
     
     print("\n" + "=" * 60)
     print(f"🎉 Processing complete!")
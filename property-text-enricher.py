@@ -1,9 +1,27 @@
 import os
 import sys
+import json
+import time
 import requests
 import argparse
-from notion_client import Client as NotionClient
+import logging
+import threading
+from contextlib import nullcontext
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from notion_client.errors import APIResponseError
+from notion_client.helpers import iterate_paginated_api
 from dotenv import load_dotenv
+from api_utils import TokenBucket, make_notion_client, notion_call, rate_limited
+from cache_store import CacheStore, make_key
+
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    # orjson is optional; the standard library gives the same result, just slower
+    from json import loads as json_loads
 
 load_dotenv()
 
@@ -13,163 +31,324 @@ SINGLE_FILL_PROMPT_ID = os.getenv("SINGLE_FILL_PROMPT_ID")
 SINGLE_FILL_PROMPT_VERSION = os.getenv("SINGLE_FILL_PROMPT_VERSION")
 OPENAI_ENDPOINT = os.getenv("OPENAI_ENDPOINT", "https://api.openai.com/v1/responses")
 
-notion = NotionClient(auth=NOTION_KEY)
+notion = make_notion_client(NOTION_KEY)
 
-def call_openai_api(prompt_text, input_text, max_tokens=500):
-    """Call OpenAI Responses API using a custom prompt with combined prompt and input text."""
-    print(f"🤖 Generating text for: {input_text[:50]}...")
-    
-    if not OPENAI_API_KEY:
-        print("⚠️  OPENAI_API_KEY not found in environment variables")
-        print("   Please add your OpenAI API key to .env")
-        return None
-    
-    if not SINGLE_FILL_PROMPT_ID:
-        print("⚠️  SINGLE_FILL_PROMPT_ID not found in environment variables")
-        print("   Please add your custom prompt ID to .env")
-        return None
-    
-    if not SINGLE_FILL_PROMPT_VERSION:
-        print("⚠️  SINGLE_FILL_PROMPT_VERSION not found in environment variables")
-        print("   Please add your custom prompt version to .env")
-        return None
-    
-    headers = {
-        "Authorization": f"Bearer {OPENAI_API_KEY}",
-        "Content-Type": "application/json"
+# Per-page progress goes through this logger so --quiet can drop it
+log = logging.getLogger(__name__)
+
+# (connect, read) timeouts in seconds; generation can take a while, so the read limit is generous
+OPENAI_TIMEOUT = (5, 60)
+
+# The Batch API lives next to the Responses endpoint (e.g. https://api.openai.com/v1)
+OPENAI_API_BASE = OPENAI_ENDPOINT.rstrip("/").rsplit("/", 1)[0]
+BATCH_FINAL_STATUSES = frozenset({"completed", "failed", "expired", "cancelled"})
+BATCH_MAX_POLL_INTERVAL = 60
+
+# Below this many pages to generate, --batch sends them directly instead
+BATCH_MIN_PAGES = 5
+
+# Pages are processed a few at a time, which keeps well inside OpenAI's request
+# limits and near Notion's ~3 requests per second
+MAX_WORKERS = 4
+
+# At most this many fetched pages wait for or occupy a worker at any time
+PENDING_SLOTS = threading.BoundedSemaphore(MAX_WORKERS * 2)
+
+# Held around each Notion write with --concurrency-mode serial
+WRITE_LOCK = threading.Lock()
+
+# Generation requests are paced so the workers settle at a steady rate inside
+# OpenAI's per-minute request limit instead of bursting into 429s
+OPENAI_LIMITER = TokenBucket(rate=5, capacity=MAX_WORKERS)
+
+# One keep-alive session for all OpenAI requests, with a socket per worker
+# thread, so each call after the first skips the TCP/TLS handshake. Rate limits
+# and server errors are retried with exponential backoff; POST is opted in since
+# a failed generation is safe to repeat
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(
+    pool_maxsize=MAX_WORKERS,
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=frozenset({"POST"}),
+        raise_on_status=False
+    )
+))
+SESSION.headers.update({
+    "Authorization": f"Bearer {OPENAI_API_KEY}",
+    "Content-Type": "application/json"
+})
+
+def prompt_message(prompt_text):
+    """Build the system message for a prompt."""
+    return {"role": "system", "content": prompt_text}
+
+def _output_items_text(data):
+    """Yield the text of each output item, including every part of message items."""
+    for item in data.get("output") or []:
+        content = item.get("content")
+        if item.get("type") == "text":
+            yield content
+        elif item.get("type") == "message":
+            if isinstance(content, str):
+                yield content
+            elif isinstance(content, list):
+                for part in content:
+                    if part.get("type") in ("output_text", "text"):
+                        yield part.get("text")
+
+def _fallback_text(data):
+    """Read the top-level text field, which some responses use instead of output."""
+    text = data.get("text")
+    if isinstance(text, dict) and "content" in text:
+        return text["content"]
+    return text if isinstance(text, str) or not text else str(text)
+
+# Places generated text can be found in a Responses API body, most common first
+_TEXT_EXTRACTORS = (
+    lambda data: [data.get("output_text")],
+    _output_items_text,
+    lambda data: [_fallback_text(data)],
+)
+
+def extract_generated_text(data):
+    """Return the first non-empty text in the response, trying _TEXT_EXTRACTORS in order."""
+    for extractor in _TEXT_EXTRACTORS:
+        for text in extractor(data):
+            if isinstance(text, str) and text.strip():
+                return text.strip()
+    return None
+
+# The parts of every request body that don't depend on the page, built once
+PAYLOAD_TEMPLATE = {
+    "prompt": {
+        "id": SINGLE_FILL_PROMPT_ID,
+        "version": SINGLE_FILL_PROMPT_VERSION
+    },
+    "temperature": 0.7,
+    "stream": False,
+    "store": False
+}
+
+def build_payload(prompt_text, input_text, max_tokens=500):
+    """Build the Responses API request body for one page."""
+    return {
+        **PAYLOAD_TEMPLATE,
+        # The prompt text goes first in its own message, so every page sends an
+        # identical prefix that OpenAI's prompt caching can reuse
+        "input": [prompt_message(prompt_text), {"role": "user", "content": input_text}],
+        "max_output_tokens": max_tokens
     }
+
+def call_openai_api(prompt_text, input_text, max_tokens=500):
+    """Call OpenAI Responses API using a custom prompt, with the prompt text as a system message."""
+    log.info(f"🤖 Generating text for: {input_text[:50]}...")
     
-    # Combine the prompt text with the input text
-    combined_input = f"{prompt_text}\n\n{input_text}"
-    
-    payload = {
-        "prompt": {
-            "id": SINGLE_FILL_PROMPT_ID,
-            "version": SINGLE_FILL_PROMPT_VERSION
-        },
-        "input": combined_input,
-        "max_output_tokens": max_tokens,
-        "temperature": 0.7,
-        "store": False
-    }
+    # main() has already checked OPENAI_API_KEY and the prompt ID and version
+    payload = build_payload(prompt_text, input_text, max_tokens)
     
     try:
-        response = requests.post(
+        OPENAI_LIMITER.acquire()
+        response = SESSION.post(
             OPENAI_ENDPOINT,
-            headers=headers,
-            json=payload
+            json=payload,
+            timeout=OPENAI_TIMEOUT
         )
         response.raise_for_status()
         
-        data = response.json()
-        
-        # Add debug output to see the actual response structure
-        print(f"🔍 DEBUG: Full response keys: {list(data.keys())}")
-        if "text" in data:
-            print(f"🔍 DEBUG: Top-level text field: {data['text']}")
-        if "output" in data and data["output"]:
-            print(f"🔍 DEBUG: Output array has {len(data['output'])} items")
-            for i, item in enumerate(data["output"][:2]):  # Show first 2 items
-                print(f"🔍 DEBUG: Output item {i}: {item}")
+        data = json_loads(response.content)
         
-        # Parse Responses API output - try simple format first, then complex format
-        # Method 1: Simple text response (most common for text generation)
-        if "output_text" in data and data["output_text"]:
-            generated_text = data["output_text"].strip()
-            if generated_text:
-                print(f"✅ Generated text: {generated_text[:100]}...")
-                return generated_text
+        # Only dump the response structure when --debug asked for it, so the
+        # formatting work is skipped on normal runs
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug(f"🔍 DEBUG: Full response keys: {list(data.keys())}")
+            for i, item in enumerate((data.get("output") or [])[:2]):  # Show first 2 items
+                log.debug(f"🔍 DEBUG: Output item {i}: {item}")
         
-        # Method 2: Complex output array format (for tool calls, multi-step responses)
-        if "output" in data and data["output"]:
-            # The output is an array of items, look for text content
-            for item in data["output"]:
-                print(f"🔍 DEBUG: Processing item: {item}")
-                
-                if item.get("type") == "text" and item.get("content"):
-                    generated_text = item.get("content", "").strip()
-                    if generated_text:
-                        print(f"✅ Generated text: {generated_text[:100]}...")
-                        return generated_text
-                # Also check for direct text field in items
-                elif item.get("type") == "message" and item.get("content"):
-                    # Handle message type responses
-                    content = item.get("content")
-                    print(f"🔍 DEBUG: Message content: {content}")
-                    if isinstance(content, list):
-                        for content_item in content:
-                            print(f"🔍 DEBUG: Content item: {content_item}")
-                            # Fix: Check for "output_text" type and extract "text" field
-                            if content_item.get("type") == "output_text" and content_item.get("text"):
-                                print(f"🔍 DEBUG: Found output_text type item")
-                                print(f"🔍 DEBUG: Raw text value: {repr(content_item.get('text'))}")
-                                generated_text = content_item.get("text", "").strip()
-                                print(f"🔍 DEBUG: After processing: {repr(generated_text)}")
-                                if generated_text:
-                                    print(f"✅ Generated text: {generated_text[:100]}...")
-                                    return generated_text
-                            # Also keep the original logic for "text" type
-                            elif content_item.get("type") == "text" and content_item.get("text"):
-                                generated_text = content_item.get("text", "").strip()
-                                if generated_text:
-                                    print(f"✅ Generated text: {generated_text[:100]}...")
-                                    return generated_text
-                    elif isinstance(content, str):
-                        generated_text = content.strip()
-                        if generated_text:
-                            print(f"✅ Generated text: {generated_text[:100]}...")
-                            return generated_text
-        
-        # Method 3: Fallback to check direct text field (only if nothing found above)
-        print("🔍 DEBUG: No text found in output array, trying fallback methods...")
-        if "text" in data and data["text"]:
-            print(f"🔍 DEBUG: Trying fallback text field: {data['text']}")
-            if isinstance(data["text"], dict) and "content" in data["text"]:
-                generated_text = data["text"]["content"].strip()
-            elif isinstance(data["text"], str):
-                generated_text = data["text"].strip()
-            else:
-                generated_text = str(data["text"]).strip()
-            
-            if generated_text:
-                print(f"✅ Generated text (fallback): {generated_text[:100]}...")
-                return generated_text
+        generated_text = extract_generated_text(data)
+        if generated_text:
+            log.info(f"✅ Generated text: {generated_text[:100]}...")
+            return generated_text
         
         # If we get here, no text was found
-        print("❌ No text content found in API response")
-        print(f"Response keys: {list(data.keys())}")
+        log.error("❌ No text content found in API response")
+        log.info(f"Response keys: {list(data.keys())}")
         
         # Enhanced debugging - show structure of key fields
         if "output_text" in data:
-            print(f"output_text: {data['output_text']}")
+            log.info(f"output_text: {data['output_text']}")
         if "output" in data:
-            print(f"Output array length: {len(data['output']) if data['output'] else 0}")
+            log.info(f"Output array length: {len(data['output']) if data['output'] else 0}")
             if data['output']:
-                print(f"First output item: {data['output'][0]}")
+                log.info(f"First output item: {data['output'][0]}")
         if "text" in data:
-            print(f"Text field: {data['text']}")
+            log.info(f"Text field: {data['text']}")
         
         return None
         
-    except requests.exceptions.RequestException as e:
-        print(f"❌ Error calling OpenAI Responses API: {e}")
+    except (requests.exceptions.RequestException, ValueError) as e:
+        log.error(f"❌ Error calling OpenAI Responses API: {e}")
         # Print response content for debugging
         if hasattr(e, 'response') and e.response is not None:
             try:
                 error_data = e.response.json()
-                print(f"Error details: {error_data}")
+                log.error(f"Error details: {error_data}")
             except:
-                print(f"Response content: {e.response.text}")
+                log.error(f"Response content: {e.response.text}")
         return None
 
+# Database IDs found by name, so later runs skip the search
+DATABASE_CACHE = CacheStore("notion_database_id")
+DATABASE_CACHE_TTL = 30 * 24 * 60 * 60
+
+# Pages with the same input share one generation, in this run and the next ones
+TEXT_CACHE = CacheStore("openai_text")
+TEXT_CACHE_TTL = 7 * 24 * 60 * 60
+
+def text_cache_key(prompt_text, input_text, max_tokens):
+    return make_key(
+        SINGLE_FILL_PROMPT_ID, SINGLE_FILL_PROMPT_VERSION, prompt_text, input_text.strip(), max_tokens
+    )
+
+def generate_text(prompt_text, input_text, max_tokens=500, use_cache=True):
+    """Return call_openai_api's text, reusing a cached result for the same prompt and input."""
+    cache_key = text_cache_key(prompt_text, input_text, max_tokens)
+    cached = TEXT_CACHE.get(cache_key) if use_cache else None
+    if cached:
+        log.info(f"✅ Reusing generated text: {cached[:100]}...")
+        return cached
+    
+    generated_text = call_openai_api(prompt_text, input_text, max_tokens)
+    if generated_text:
+        TEXT_CACHE.set(cache_key, generated_text, expire=TEXT_CACHE_TTL)
+    return generated_text
+
+def generate_texts_batch(prompt_text, input_texts, max_tokens=500, use_cache=True):
+    """Generate the text for every input through the OpenAI Batch API; returns one result per input.
+    
+    Batches cost half as much as individual calls and don't count against the
+    regular rate limits, but can take minutes (up to 24h) to finish. Inputs whose
+    request failed come back as None. Inputs with cached text are not sent.
+    """
+    results = {}
+    if use_cache:
+        for i, input_text in enumerate(input_texts):
+            cached = TEXT_CACHE.get(text_cache_key(prompt_text, input_text, max_tokens))
+            if cached:
+                results[f"page-{i}"] = cached
+        if results:
+            print(f"⚡ Using cached text for {len(results)} of {len(input_texts)} pages")
+    
+    lines = [
+        json.dumps({
+            "custom_id": f"page-{i}",
+            "method": "POST",
+            "url": "/v1/responses",
+            "body": build_payload(prompt_text, input_text, max_tokens)
+        })
+        for i, input_text in enumerate(input_texts)
+        if f"page-{i}" not in results
+    ]
+    if not lines:
+        return [results[f"page-{i}"] for i in range(len(input_texts))]
+    
+    print(f"📦 Submitting {len(lines)} pages to the OpenAI Batch API...")
+    
+    try:
+        # Drop the session's JSON content type so requests can set the multipart one
+        response = SESSION.post(
+            f"{OPENAI_API_BASE}/files",
+            data={"purpose": "batch"},
+            files={"file": ("batch.jsonl", "\n".join(lines).encode("utf-8"))},
+            headers={"Content-Type": None},
+            timeout=OPENAI_TIMEOUT
+        )
+        response.raise_for_status()
+        
+        response = SESSION.post(
+            f"{OPENAI_API_BASE}/batches",
+            json={
+                "input_file_id": json_loads(response.content)["id"],
+                "endpoint": "/v1/responses",
+                "completion_window": "24h"
+            },
+            timeout=OPENAI_TIMEOUT
+        )
+        response.raise_for_status()
+        batch = json_loads(response.content)
+        print(f"⏳ Batch {batch['id']} submitted, waiting for it to finish...")
+        
+        # Poll with exponential backoff, capped at a minute between checks
+        attempt = 0
+        while batch["status"] not in BATCH_FINAL_STATUSES:
+            time.sleep(min(BATCH_MAX_POLL_INTERVAL, 2 ** attempt))
+            attempt += 1
+            response = SESSION.get(f"{OPENAI_API_BASE}/batches/{batch['id']}", timeout=OPENAI_TIMEOUT)
+            response.raise_for_status()
+            batch = json_loads(response.content)
+            counts = batch.get("request_counts") or {}
+            print(f"   {batch['status']}: {counts.get('completed', 0)}/{counts.get('total', len(lines))} done")
+        
+        if not batch.get("output_file_id"):
+            print(f"❌ Batch {batch['id']} ended with status '{batch['status']}' and no output")
+            return [results.get(f"page-{i}") for i in range(len(input_texts))]
+        
+        response = SESSION.get(
+            f"{OPENAI_API_BASE}/files/{batch['output_file_id']}/content",
+            timeout=OPENAI_TIMEOUT
+        )
+        response.raise_for_status()
+        
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f"❌ Error calling OpenAI Batch API: {e}")
+        return [results.get(f"page-{i}") for i in range(len(input_texts))]
+    
+    # Results come back in completion order, so match them up by custom_id
+    for line in response.content.splitlines():
+        if not line.strip():
+            continue
+        result = json_loads(line)
+        body = (result.get("response") or {}).get("body")
+        if result.get("error") or not body or result["response"].get("status_code", 200) >= 400:
+            log.error(f"❌ Batch request {result.get('custom_id')} failed: {result.get('error') or body}")
+            continue
+        generated_text = extract_generated_text(body)
+        if generated_text:
+            i = int(result["custom_id"].split("-")[1])
+            results[result["custom_id"]] = generated_text
+            TEXT_CACHE.set(text_cache_key(prompt_text, input_texts[i], max_tokens), generated_text,
+                           expire=TEXT_CACHE_TTL)
+    
+    return [results.get(f"page-{i}") for i in range(len(input_texts))]
+
 def get_database_by_name(database_name):
     """Find a database by its title/name."""
+    target = database_name.casefold()
+    
+    # Reuse the ID found on an earlier run; one retrieve confirms it still
+    # exists and is shared, which is much cheaper than searching again
+    cache_key = make_key(NOTION_KEY, target)
+    cached_id = DATABASE_CACHE.get(cache_key)
+    if cached_id:
+        try:
+            notion_call(notion.databases.retrieve, database_id=cached_id)
+            print(f"⚡ Using cached database: {database_name} (ID: {cached_id})")
+            return cached_id
+        except Exception as e:
+            # Only a rejection says the ID is stale; after a timeout or a
+            # 5xx keep the entry and fall back to searching for this run
+            if isinstance(e, APIResponseError) and e.status in (403, 404):
+                DATABASE_CACHE.delete(cache_key)
+    
     print(f"🔍 Searching for database: {database_name}")
     
     try:
         # List ALL databases the integration has access to
         print("🔍 Listing all accessible databases...")
-        all_response = notion.search(
+        all_response = notion_call(
+            notion.search,
             filter={"property": "object", "value": "database"}
         )
         
@@ -195,8 +374,9 @@ def get_database_by_name(database_name):
                 print(f"  ✅ {db_title}")
                 
                 # Check for exact match (case-insensitive)
-                if db_title.lower() == database_name.lower():
+                if db_title.casefold() == target:
                     print(f"🎯 Found matching database: {db_title} (ID: {db['id']})")
+                    DATABASE_CACHE.set(cache_key, db["id"], expire=DATABASE_CACHE_TTL)
                     return db["id"]
         
         # If we get here, no exact match was found
@@ -214,12 +394,13 @@ def get_database_by_name(database_name):
 
 def update_page_with_text(page_id, output_property, generated_text, page_title):
     """Update a Notion page with generated text in the specified property."""
-    print(f"🔄 Updating {output_property} for: {page_title}")
-    print(f"🔍 DEBUG: Value being sent to Notion: {repr(generated_text)}")
-    print(f"🔍 DEBUG: Value type: {type(generated_text)}")
+    log.info(f"🔄 Updating {output_property} for: {page_title}")
+    # %-style arguments so the repr is only built when --debug is on
+    log.debug("🔍 DEBUG: Value being sent to Notion: %r", generated_text)
     
     try:
-        notion.pages.update(
+        notion_call(
+            notion.pages.update,
             page_id=page_id,
             properties={
                 output_property: {
@@ -232,47 +413,139 @@ def update_page_with_text(page_id, output_property, generated_text, page_title):
                 }
             }
         )
-        print(f"✅ Text updated for: {page_title}")
+        log.info(f"✅ Text updated for: {page_title}")
         return True
         
     except Exception as e:
-        print(f"❌ Error updating page {page_title}: {e}")
+        log.error(f"❌ Error updating page {page_title}: {e}")
         return False
 
+def _first_plain_text(items):
+    return items[0].get("plain_text", "") if items else None
+
+def _formula_value(prop):
+    """Extract a formula (Function) property's result as text."""
+    formula_data = prop.get("formula", {})
+    formula_type = formula_data.get("type")
+    
+    if formula_type == "string":
+        return formula_data.get("string", "")
+    if formula_type in ("number", "boolean"):
+        value = formula_data.get(formula_type)
+        return str(value) if value is not None else ""
+    if formula_type == "date":
+        date_data = formula_data.get("date", {})
+        if date_data:
+            return date_data.get("start", "")
+    return None
+
+# Text extractor for each supported property type, looked up once per property
+_EXTRACTORS = {
+    "title": lambda prop: _first_plain_text(prop.get("title")),
+    "rich_text": lambda prop: _first_plain_text(prop.get("rich_text")),
+    "plain_text": lambda prop: prop.get("plain_text", ""),
+    "formula": _formula_value,
+}
+
 def get_property_value(page_properties, property_name):
     """Extract text value from a Notion property."""
     prop = page_properties.get(property_name, {})
-    prop_type = prop.get("type")
-    
-    if prop_type == "title":
-        title_list = prop.get("title", [])
-        if title_list:
-            return title_list[0].get("plain_text", "")
-    elif prop_type == "rich_text":
-        rich_text_list = prop.get("rich_text", [])
-        if rich_text_list:
-            return rich_text_list[0].get("plain_text", "")
-    elif prop_type == "plain_text":
-        return prop.get("plain_text", "")
-    elif prop_type == "formula":
-        # Handle formula (Function) properties
-        formula_data = prop.get("formula", {})
-        formula_type = formula_data.get("type")
-        
-        if formula_type == "string":
-            return formula_data.get("string", "")
-        elif formula_type == "number":
-            number_val = formula_data.get("number")
-            return str(number_val) if number_val is not None else ""
-        elif formula_type == "boolean":
-            boolean_val = formula_data.get("boolean")
-            return str(boolean_val) if boolean_val is not None else ""
-        elif formula_type == "date":
-            date_data = formula_data.get("date", {})
-            if date_data:
-                return date_data.get("start", "")
+    extract = _EXTRACTORS.get(prop.get("type"))
+    return extract(prop) if extract else None
+
+def get_page_title(properties):
+    """Return the plain text of the page's title property, or "Untitled"."""
+    title_prop = next((prop for prop in properties.values() if prop.get("type") == "title"), None)
+    return (title_prop and _first_plain_text(title_prop.get("title"))) or "Untitled"
+
+def iter_pages(database_id, page_filter=None):
+    """Yield every page in the database, following the cursor 100 pages at a time.
     
-    return None
+    The next batch is only fetched once the previous one has been consumed.
+    """
+    query = {"database_id": database_id, "page_size": 100}
+    if page_filter:
+        query["filter"] = page_filter
+    return iterate_paginated_api(rate_limited(notion.databases.query), **query)
+
+def read_page(i, page, args):
+    """Return (page_id, page_title, input_value) for a page that needs text, or None to skip it."""
+    properties = page["properties"]
+    page_id = page["id"]
+    
+    # Get page title for display
+    page_title = get_page_title(properties)
+    
+    log.info(f"\n🔄 Processing page {i}: {page_title}")
+    log.info("-" * 40)
+    
+    # Check if output property already has text (if skip-existing is enabled)
+    if args.skip_existing:
+        output_prop = properties.get(args.output_property, {})
+        existing_text = output_prop.get("rich_text", [])
+        if existing_text and existing_text[0].get("plain_text", "").strip():
+            log.info(f"⏭️  Skipping {page_title} - already has text in {args.output_property}")
+            return None
+    
+    # Get input property value
+    input_value = get_property_value(properties, args.input_property)
+    
+    if not input_value:
+        log.warning(f"⚠️  No text found in {args.input_property} for: {page_title}")
+        return None
+    
+    log.info(f"📝 Input text: {input_value}")
+    return page_id, page_title, input_value
+
+def write_page(page_id, page_title, generated_text, args):
+    """Write the generated text to the page; returns "processed" or "error"."""
+    if not generated_text:
+        log.warning(f"⚠️  No text generated for: {page_title}")
+        return "error"
+    
+    # Update page with generated text; in serial mode writes take turns so no two land at once
+    with WRITE_LOCK if args.concurrency_mode == "serial" else nullcontext():
+        updated = update_page_with_text(page_id, args.output_property, generated_text, page_title)
+    if updated:
+        return "processed"
+    return "error"
+
+def process_page(i, page, args):
+    """Generate and write the text for one page; returns "processed", "skipped" or "error"."""
+    item = read_page(i, page, args)
+    if item is None:
+        return "skipped"
+    
+    page_id, page_title, input_value = item
+    generated_text = generate_text(args.prompt_text, input_value, args.max_tokens, use_cache=not args.no_cache)
+    return write_page(page_id, page_title, generated_text, args)
+
+def process_batch(items, args):
+    """Generate text for every read page in one OpenAI batch, then write the pages.
+    
+    items holds read_page's result for each page. With fewer than BATCH_MIN_PAGES
+    pages to generate, waiting on a batch isn't worth it, so they are sent directly.
+    """
+    pending = [item for item in items if item is not None]
+    results = Counter(skipped=len(items) - len(pending))
+    input_texts = [input_value for _, _, input_value in pending]
+    
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        if len(pending) >= BATCH_MIN_PAGES:
+            texts = generate_texts_batch(args.prompt_text, input_texts, args.max_tokens, use_cache=not args.no_cache)
+        else:
+            texts = list(executor.map(
+                lambda input_value: generate_text(args.prompt_text, input_value, args.max_tokens,
+                                                  use_cache=not args.no_cache),
+                input_texts
+            ))
+        
+        futures = [
+            executor.submit(write_page, page_id, page_title, generated_text, args)
+            for (page_id, page_title, _), generated_text in zip(pending, texts)
+        ]
+        results.update(future.result() for future in futures)
+    return results
 
 def main():
     parser = argparse.ArgumentParser(description="Enrich Notion database pages with AI-generated text using custom prompts")
@@ -284,8 +557,21 @@ def main():
                        help="Skip pages that already have text in the output property")
     parser.add_argument("--max-tokens", type=int, default=500,
                        help="Maximum tokens for AI response (default: 500)")
+    parser.add_argument("--concurrency-mode", choices=["serial", "parallel"], default="serial",
+                       help="Write Notion updates one at a time (serial, default) or from every worker (parallel); "
+                            "lookups run in parallel either way")
+    parser.add_argument("--batch", action="store_true",
+                       help="Generate the text through the OpenAI Batch API (half price, but can take minutes or longer)")
+    parser.add_argument("--no-cache", action="store_true",
+                       help="Generate the text again instead of reusing text generated for the same input")
+    parser.add_argument("--quiet", action="store_true",
+                       help="Only print warnings, errors and the final summary instead of per-page progress")
+    parser.add_argument("--debug", action="store_true",
+                       help="Also print the raw OpenAI response structure and the values sent to Notion")
     
     args = parser.parse_args()
+    logging.basicConfig(stream=sys.stdout, format="%(message)s",
+                        level=logging.DEBUG if args.debug else logging.WARNING if args.quiet else logging.INFO)
     
     if not NOTION_KEY:
         print("❌ NOTION_KEY not found in environment variables")
@@ -319,75 +605,53 @@ def main():
     if not database_id:
         return 1
     
-    # Query the database
-    print(f"📚 Fetching pages from database: {args.database_name}")
-    try:
-        response = notion.databases.query(database_id=database_id)
-        pages = response.get("results", [])
-        print(f"📋 Found {len(pages)} pages to process")
-    except Exception as e:
-        print(f"❌ Error querying database: {e}")
-        return 1
-    
-    if not pages:
-        print("⚠️  No pages found in database")
-        return 0
+    # Let Notion leave out pages that already have a value
+    page_filter = None
+    if args.skip_existing:
+        page_filter = {"property": args.output_property, "rich_text": {"is_empty": True}}
     
+    print(f"📚 Fetching pages from database: {args.database_name}")
     print("=" * 60)
-    
-    # Process each page
-    processed = 0
-    skipped = 0
-    errors = 0
-    
-    for i, page in enumerate(pages, 1):
-        properties = page["properties"]
-        page_id = page["id"]
-        
-        # Get page title for display
-        page_title = "Untitled"
-        for prop_name, prop_data in properties.items():
-            if prop_data.get("type") == "title":
-                title_list = prop_data.get("title", [])
-                if title_list:
-                    page_title = title_list[0].get("plain_text", "Untitled")
-                break
-        
-        print(f"\n🔄 Processing page {i}/{len(pages)}: {page_title}")
-        print("-" * 40)
-        
-        # Check if output property already has text (if skip-existing is enabled)
-        if args.skip_existing:
-            output_prop = properties.get(args.output_property, {})
-            existing_text = output_prop.get("rich_text", [])
-            if existing_text and existing_text[0].get("plain_text", "").strip():
-                print(f"⏭️  Skipping {page_title} - already has text in {args.output_property}")
-                skipped += 1
-                continue
-        
-        # Get input property value
-        input_value = get_property_value(properties, args.input_property)
-        
-        if not input_value:
-            print(f"⚠️  No text found in {args.input_property} for: {page_title}")
-            skipped += 1
-            continue
+    if args.batch:
+        # Read every page first, then generate all the text in one batch
+        try:
+            items = [read_page(i, page, args) for i, page in enumerate(iter_pages(database_id, page_filter), 1)]
+        except Exception as e:
+            print(f"❌ Error querying database: {e}")
+            return 1
         
-        print(f"📝 Input text: {input_value}")
+        if not items:
+            print("⚠️  No pages found in database")
+            return 0
         
-        # Generate text using AI
-        generated_text = call_openai_api(args.prompt_text, input_value, args.max_tokens)
-        
-        if not generated_text:
-            print(f"⚠️  No text generated for: {page_title}")
-            errors += 1
-            continue
-        
-        # Update page with generated text
-        if update_page_with_text(page_id, args.output_property, generated_text, page_title):
-            processed += 1
-        else:
-            errors += 1
+        print(f"📋 Found {len(items)} pages to process")
+        results = process_batch(items, args)
+    else:
+        # Process the pages a few at a time; each one only waits on its own
+        # OpenAI call and Notion update. Pages are handed to the pool as they
+        # stream in, so only a bounded number are held in memory at once
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            futures = []
+            try:
+                for i, page in enumerate(iter_pages(database_id, page_filter), 1):
+                    # Wait for a free slot so unprocessed pages don't pile up in the queue
+                    PENDING_SLOTS.acquire()
+                    future = executor.submit(process_page, i, page, args)
+                    future.add_done_callback(lambda _: PENDING_SLOTS.release())
+                    futures.append(future)
+            except Exception as e:
+                print(f"❌ Error querying database: {e}")
+                return 1
+            
+            if not futures:
+                print("⚠️  No pages found in database")
+                return 0
+            
+            print(f"📋 Found {len(futures)} pages to process")
+            results = Counter(future.result() for future in futures)
+    processed = results["processed"]
+    skipped = results["skipped"]
+    errors = results["error"]
     
     print("\n" + "=" * 60)
     print(f"🎉 Processing complete!")
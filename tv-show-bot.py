@@ -1,65 +1,157 @@
-import os, requests
-from notion_client import Client as NotionClient
+import os, sys, argparse, logging, threading, requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
+from notion_client.helpers import iterate_paginated_api
+from api_utils import TokenBucket, make_notion_client, notion_call, rate_limited
+from cache_store import CacheStore, make_key
+
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    # orjson is optional; the standard library gives the same result, just slower
+    from json import loads as json_loads
+
 load_dotenv()
 
 TMDB_KEY   = os.getenv("TMDB_KEY")
 NOTION_KEY = os.getenv("NOTION_KEY")
 DB_ID      = os.getenv("NOTION_SHOW_DB")
 
-notion = NotionClient(auth=NOTION_KEY)
+notion = make_notion_client(NOTION_KEY)
 TMDB_BASE = "https://api.themoviedb.org/3"
 
-def get_poster_url(title):
-    print(f"🔍 Searching for poster: {title}")
-    q = f"{TMDB_BASE}/search/tv?api_key={TMDB_KEY}&query={title}"
-    res = requests.get(q).json()["results"]
+# Per-show progress goes through this logger so --quiet can drop it
+log = logging.getLogger(__name__)
+
+# (connect, read) timeouts in seconds so a dead endpoint can't hang the run
+REQUEST_TIMEOUT = (3.05, 30)
+
+# Shows are processed a few at a time; Notion allows about 3 requests per
+# second per integration, so going much wider only trades waiting for 429s
+MAX_WORKERS = 4
+
+# At most this many fetched rows wait for or occupy a worker at any time
+PENDING_SLOTS = threading.BoundedSemaphore(MAX_WORKERS * 2)
+
+# One keep-alive session for all TMDb requests, with a socket per worker thread.
+# Rate limits and server errors are retried with exponential backoff (1, 2, 4, 8s),
+# waiting longer when TMDb sends a Retry-After header
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(
+    pool_maxsize=MAX_WORKERS,
+    max_retries=Retry(total=4, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504])
+))
+
+# TMDb allows roughly 40 requests per 10 seconds per IP; pace the workers so
+# bursts never run into 429s and the retries they cost
+TMDB_LIMITER = TokenBucket(rate=4, capacity=40)
+
+# TMDb metadata for a show rarely changes, so keep it for a month
+TMDB_CACHE = CacheStore("tmdb")
+TMDB_CACHE_TTL = 30 * 24 * 60 * 60
+
+# Properties this script fills in, when the database has them with this type
+ENRICHED_PROPERTIES = {
+    "Poster": "files",
+    "Synopsis": "rich_text",
+    "Year": "number",
+}
+
+# Notion filter matching a row whose property is still empty, by property
+EMPTY_FILTERS = {name: {prop_type: {"is_empty": True}} for name, prop_type in ENRICHED_PROPERTIES.items()}
+
+# The only fields read from TMDb search results and show details
+SEARCH_FIELDS = ("id", "poster_path", "first_air_date", "overview")
+DETAILS_FIELDS = ("id", "first_air_date", "overview")
+
+def search_show(title):
+    """Return TMDb's best search match for the show, or None if nothing matched.
+    
+    Matches are cached on disk by title; misses are not, so a show that TMDb
+    adds later is still picked up on the next run.
+    """
+    cache_key = make_key("search/tv", title)
+    cached = TMDB_CACHE.get(cache_key)
+    if cached:
+        return cached
+    
+    TMDB_LIMITER.acquire()
+    # Let requests encode the title; titles with &, # or spaces break a hand-built query string
+    res = json_loads(SESSION.get(
+        f"{TMDB_BASE}/search/tv",
+        params={"api_key": TMDB_KEY, "query": title},
+        timeout=REQUEST_TIMEOUT
+    ).content).get("results", [])
     if not res:
-        print(f"❌ No poster found for {title}")
         return None
-    path = res[0]["poster_path"]
+    
+    # Only keep the fields we read, so cached matches stay small
+    match = {key: res[0].get(key) for key in SEARCH_FIELDS}
+    TMDB_CACHE.set(cache_key, match, expire=TMDB_CACHE_TTL)
+    return match
+
+def get_show_details(tmdb_id):
+    """Return the first air date and overview TMDb has for a show, cached on disk."""
+    cache_key = make_key("tv", tmdb_id)
+    cached = TMDB_CACHE.get(cache_key)
+    if cached:
+        return cached
+    
+    TMDB_LIMITER.acquire()
+    details = json_loads(SESSION.get(
+        f"{TMDB_BASE}/tv/{tmdb_id}",
+        params={"api_key": TMDB_KEY},
+        timeout=REQUEST_TIMEOUT
+    ).content)
+    
+    # Only keep what we use, and don't cache error bodies (they have no id)
+    details = {key: details.get(key) for key in DETAILS_FIELDS}
+    if details["id"] is not None:
+        TMDB_CACHE.set(cache_key, details, expire=TMDB_CACHE_TTL)
+    return details
+
+def get_poster_url(title):
+    log.info(f"🔍 Searching for poster: {title}")
+    match = search_show(title)
+    if not match or not match.get("poster_path"):
+        log.error(f"❌ No poster found for {title}")
+        return None
+    path = match["poster_path"]
     url = f"https://image.tmdb.org/t/p/w500{path}"
-    print(f"📸 Found poster for {title}: {url}")
+    log.info(f"📸 Found poster for {title}: {url}")
     return url
 
-def update_row(page_id, title, url):
-    print(f"🔄 Updating poster for {title}...")
-    notion.pages.update(
-        page_id=page_id,
-        properties={
-            "Poster": {
-                "files": [
-                    {
-                        "name": f"{title} poster",       # ← required!
-                        "type": "external",
-                        "external": {"url": url}
-                    }
-                ]
+def format_poster(title, url):
+    """Build the Poster property value pointing at an external image URL."""
+    return {
+        "files": [
+            {
+                "name": f"{title} poster",       # ← required!
+                "type": "external",
+                "external": {"url": url}
             }
-        }
-    )
-    print(f"✅ Poster updated for {title}")
+        ]
+    }
 
 def fetch_show_details(title: str) -> tuple[int | None, str | None]:
     """Return the show year and synopsis, or None if not found."""
-    print(f"📺 Searching for TV show details: {title}")
+    log.info(f"📺 Searching for TV show details: {title}")
     # 1) Search for the TV show on TMDb
-    resp = requests.get(
-        f"{TMDB_BASE}/search/tv",
-        params={"api_key": TMDB_KEY, "query": title}
-    ).json().get("results", [])
-    if not resp:
-        print(f"❌ No TV show found for details search: {title}")
+    match = search_show(title)
+    if not match:
+        log.error(f"❌ No TV show found for details search: {title}")
         return None, None
 
-    tmdb_id = resp[0]["id"]
-    print(f"📺 Found TV show ID {tmdb_id} for {title}")
+    tmdb_id = match["id"]
+    log.info(f"📺 Found TV show ID {tmdb_id} for {title}")
     
-    # 2) Fetch full TV show details
-    details = requests.get(
-        f"{TMDB_BASE}/tv/{tmdb_id}",
-        params={"api_key": TMDB_KEY}
-    ).json()
+    # 2) Search results already carry the first air date and overview; only
+    # fetch the full details when one of them is missing
+    details = match
+    if not (match.get("first_air_date") and match.get("overview")):
+        details = get_show_details(tmdb_id)
     
     # Extract year from first_air_date
     first_air_date = details.get("first_air_date")
@@ -70,76 +162,110 @@ def fetch_show_details(title: str) -> tuple[int | None, str | None]:
     synopsis = details.get("overview")
     
     if year:
-        print(f"📅 Year found for {title}: {year}")
+        log.info(f"📅 Year found for {title}: {year}")
     else:
-        print(f"⚠️  No year data available for {title}")
+        log.warning(f"⚠️  No year data available for {title}")
         
     if synopsis:
-        print(f"📝 Synopsis found for {title}: {synopsis[:100]}...")
+        log.info(f"📝 Synopsis found for {title}: {synopsis[:100]}...")
     else:
-        print(f"⚠️  No synopsis available for {title}")
+        log.warning(f"⚠️  No synopsis available for {title}")
         
     return year, synopsis
 
-# 1. Read the DB
-print("📚 Fetching TV shows from Notion database...")
-rows = notion.databases.query(database_id=DB_ID).get("results")
-print(f"📋 Found {len(rows)} TV shows to process")
-print("=" * 50)
+def get_schema():
+    """Return which of ENRICHED_PROPERTIES exist in the database with the expected type, checked once per run."""
+    properties = notion_call(notion.databases.retrieve, database_id=DB_ID)["properties"]
+    schema = frozenset(
+        name for name, prop_type in ENRICHED_PROPERTIES.items()
+        if properties.get(name, {}).get("type") == prop_type
+    )
+    for name, prop_type in ENRICHED_PROPERTIES.items():
+        if name not in properties:
+            print(f"⚠️  Database has no '{name}' property - it won't be filled in")
+        elif name not in schema:
+            print(f"⚠️  '{name}' is a {properties[name]['type']} property, not {prop_type} - it won't be filled in")
+    return schema
+
+def iter_rows(schema):
+    """Yield every TV show still missing one of the schema's properties.
+    
+    Complete rows are filtered out by Notion, so they are never downloaded;
+    the next page is only fetched when needed.
+    """
+    conditions = [{"property": name, **EMPTY_FILTERS[name]} for name in ENRICHED_PROPERTIES if name in schema]
+    if not conditions:
+        return iter(())
+    return iterate_paginated_api(
+        rate_limited(notion.databases.query),
+        database_id=DB_ID,
+        filter={"or": conditions},
+        page_size=100
+    )
+
+def process_row(i, row, schema):
+    """Fill in the poster, year and synopsis for one TV show row.
+    
+    schema is the set of ENRICHED_PROPERTIES the database has; the others are
+    neither read nor written.
+    """
+    props = row["properties"]
 
-# 2. Loop through each TV show
-for i, row in enumerate(rows, 1):
     # Check if title exists and is not empty
-    title_list = row["properties"]["Name"]["title"]
+    title_list = props.get("Name", {}).get("title") or []
     if not title_list:
-        print(f"\n⚠️  Skipping TV show {i}/{len(rows)} - no title found")
-        continue
-        
+        log.warning(f"\n⚠️  Skipping TV show {i} - no title found")
+        return
+
     title = title_list[0]["plain_text"]
     page_id = row["id"]
-    
-    print(f"\n📺 Processing TV show {i}/{len(rows)}: {title}")
-    print("-" * 40)
-    
-    # Check if poster already exists
-    poster_property = row["properties"].get("Poster", {})
+
+    log.info(f"\n📺 Processing TV show {i}: {title}")
+    log.info("-" * 40)
+
+    # Check which properties still need filling in
+    poster_property = props.get("Poster", {})
     poster_files = poster_property.get("files", [])
-    has_poster = len(poster_files) > 0
-    
+    has_poster = "Poster" not in schema or len(poster_files) > 0
+
+    year_property = props.get("Year", {})
+    need_year = "Year" in schema and year_property.get("number") is None
+
+    synopsis_property = props.get("Synopsis", {})
+    existing_synopsis = synopsis_property.get("rich_text", [])
+    need_synopsis = "Synopsis" in schema and not existing_synopsis
+
+    # Complete rows need no TMDb or Notion calls at all
+    if has_poster and not (need_year or need_synopsis):
+        log.info(f"⏭️  {title} already has a poster, year and synopsis - skipping")
+        return
+
+    # Every change for the row is collected here and sent in a single update
+    update_properties = {}
+
     if has_poster:
-        print(f"📸 Poster already exists for {title} - skipping poster update")
+        log.info(f"📸 Poster already exists for {title} - skipping poster update")
     else:
         # Process poster
         url = get_poster_url(title)
         if url:
-            update_row(page_id, title, url)
+            update_properties["Poster"] = format_poster(title, url)
+            log.info(f"🔄 Updating poster for {title}...")
         else:
-            print(f"⚠️  Skipping poster update for {title} - no poster found")
+            log.warning(f"⚠️  Skipping poster update for {title} - no poster found")
 
-    # Check if year already exists
-    year_property = row["properties"].get("Year", {})
-    existing_year = year_property.get("number")
-    
-    # Check if synopsis already exists
-    synopsis_property = row["properties"].get("Synopsis", {})
-    existing_synopsis = synopsis_property.get("rich_text", [])
-    has_synopsis = len(existing_synopsis) > 0
-    
-    if existing_year is not None and has_synopsis:
-        print(f"📅 Year already exists for {title}: {existing_year} - skipping details update")
-        print(f"📝 Synopsis already exists for {title} - skipping details update")
+    year = synopsis = None
+    if not need_year and not need_synopsis:
+        log.info(f"📅 Year and synopsis already exist for {title} - skipping details update")
     else:
         # Fetch both year and synopsis in one API call
         year, synopsis = fetch_show_details(title)
-        
-        # Update properties that need updating
-        update_properties = {}
-        
-        if year is not None and existing_year is None:
+
+        if year is not None and need_year:
             update_properties["Year"] = {"number": year}
-            print(f"🔄 Updating year for {title}...")
-            
-        if synopsis and not has_synopsis:
+            log.info(f"🔄 Updating year for {title}...")
+
+        if synopsis and need_synopsis:
             update_properties["Synopsis"] = {
                 "rich_text": [
                     {
@@ -148,23 +274,71 @@ for i, row in enumerate(rows, 1):
                     }
                 ]
             }
-            print(f"🔄 Updating synopsis for {title}...")
-        
-        # Update Notion if we have properties to update
-        if update_properties:
-            notion.pages.update(
-                page_id=page_id,
-                properties=update_properties
-            )
-            
-            if year is not None and existing_year is None:
-                print(f"✅ Year updated for {title}: {year}")
-            if synopsis and not has_synopsis:
-                print(f"✅ Synopsis updated for {title}")
-        else:
-            print(f"⚠️  No new details to update for {title}")
+            log.info(f"🔄 Updating synopsis for {title}...")
+
+    # Update Notion if we have properties to update
+    if update_properties:
+        notion_call(
+            notion.pages.update,
+            page_id=page_id,
+            properties=update_properties
+        )
+
+        if "Poster" in update_properties:
+            log.info(f"✅ Poster updated for {title}")
+        if "Year" in update_properties:
+            log.info(f"✅ Year updated for {title}: {year}")
+        if "Synopsis" in update_properties:
+            log.info(f"✅ Synopsis updated for {title}")
+    elif need_year or need_synopsis:
+        log.warning(f"⚠️  No new details to update for {title}")
+
+    log.info(f"✅ Completed processing: {title}")
+
+def safe_process_row(i, row, schema):
+    """Process one row, reporting errors instead of stopping the other rows."""
+    try:
+        process_row(i, row, schema)
+        return True
+    except Exception as e:
+        log.error(f"❌ Error processing TV show {i} ({row.get('id')}): {e}")
+        return False
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill in posters, years and synopses for a Notion TV show database")
+    parser.add_argument("--quiet", action="store_true",
+                        help="Only print warnings, errors and the final summary instead of per-show progress")
+    args = parser.parse_args()
+    logging.basicConfig(stream=sys.stdout, format="%(message)s",
+                        level=logging.WARNING if args.quiet else logging.INFO)
+    
+    # 1. Read the DB
+    print("📚 Fetching TV shows from Notion database...")
+    schema = get_schema()
+    print("=" * 50)
+    
+    # 2. Process the shows a few at a time; each row only waits on its own
+    # TMDb and Notion calls. Rows are handed to the pool as each page arrives,
+    # so later pages are fetched while the first rows are already being processed,
+    # and only a bounded number of rows are held in memory at once
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = []
+        for i, row in enumerate(iter_rows(schema), 1):
+            # Wait for a free slot so unprocessed rows don't pile up in the queue
+            PENDING_SLOTS.acquire()
+            future = executor.submit(safe_process_row, i, row, schema)
+            future.add_done_callback(lambda _: PENDING_SLOTS.release())
+            futures.append(future)
+        print(f"📋 Found {len(futures)} TV shows to process")
+        results = [future.result() for future in futures]
     
-    print(f"✅ Completed processing: {title}")
+    print("\n" + "=" * 50)
+    failed = results.count(False)
+    if failed:
+        print(f"⚠️  Finished with {failed} of {len(results)} TV shows failing")
+        return 1
+    print("🎉 All TV shows processed!")
+    return 0
 
-print("\n" + "=" * 50)
-print("🎉 All TV shows processed!") 
\ No newline at end of file
+if __name__ == "__main__":
+    sys.exit(main())
@@ -8,12 +8,20 @@ Usage:
     python update-ranking.py --tv               # Update TV shows database
     python update-ranking.py --execute          # Actually update (default is dry-run)
     python update-ranking.py --tv --execute     # Update TV shows database with execution
+    python update-ranking.py --refresh          # Dry run without reusing rows fetched in the last 10 minutes
+    python update-ranking.py --execute --quiet  # Only print summary counts, warnings and errors
 """
 
 import os
+import sys
 import argparse
-from notion_client import Client as NotionClient
+import logging
+from dataclasses import dataclass, asdict
+from operator import attrgetter
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from api_utils import make_notion_client, notion_call
+from cache_store import CacheStore, make_key
 
 # Load environment variables
 load_dotenv()
@@ -23,6 +31,29 @@ NOTION_KEY = os.getenv("NOTION_KEY")
 NOTION_DB = os.getenv("NOTION_DB")
 NOTION_SHOW_DB = os.getenv("NOTION_SHOW_DB")
 
+# Per-row progress and the change table go through this logger so --quiet can drop them
+log = logging.getLogger(__name__)
+
+# Rankings are written a few at a time; notion_call keeps the total under
+# Notion's ~3 requests per second, so more workers would only wait longer
+MAX_WORKERS = 4
+
+# Notion properties read and written by this script
+NAME_PROPERTY = "Name"
+RANKING_PROPERTY = "Saleem Ranking"
+
+# Rows fetched by a dry run, reused by the next dry runs for a few minutes
+QUERY_CACHE = CacheStore("notion_rankings")
+QUERY_CACHE_TTL = 10 * 60
+
+@dataclass(slots=True)
+class MovieRow:
+    """One movie or show's page, its ranking in Notion and the ranking it should get"""
+    page_id: str
+    name: str
+    current_ranking: float
+    new_ranking: int | None = None
+
 def validate_environment(use_tv_db=False):
     """Validate that required environment variables are set"""
     if not NOTION_KEY:
@@ -40,8 +71,24 @@ def validate_environment(use_tv_db=False):
     
     return True
 
-def fetch_movie_data(notion_client, database_id, content_type="movies"):
-    """Fetch movie/show names and rankings from Notion database"""
+def query_cache_key(database_id):
+    """Key under which the fetched rows of a database are cached"""
+    return make_key(NOTION_KEY, database_id, RANKING_PROPERTY)
+
+def fetch_movie_data(notion_client, database_id, content_type="movies", use_cache=False):
+    """Fetch movie/show names and rankings from Notion database
+    
+    With use_cache, rows fetched in the last QUERY_CACHE_TTL seconds are reused.
+    Fresh results are always cached for the next run.
+    """
+    cache_key = query_cache_key(database_id)
+    if use_cache:
+        cached = QUERY_CACHE.get(cache_key)
+        if cached:
+            print(f"⚡ Using {len(cached)} {content_type} fetched in the last {QUERY_CACHE_TTL // 60} minutes "
+                  f"(run with --refresh to fetch them again)")
+            return [MovieRow(**movie) for movie in cached]
+    
     print(f"📚 Fetching {content_type} from Notion database...")
     
     try:
@@ -53,201 +100,171 @@ def fetch_movie_data(notion_client, database_id, content_type="movies"):
         
         while has_more:
             page_count += 1
-            print(f"📄 Fetching page {page_count}...")
+            log.info(f"📄 Fetching page {page_count}...")
             
             query_params = {
                 "database_id": database_id,
-                "page_size": 100  # Maximum allowed by Notion API
+                "page_size": 100,  # Maximum allowed by Notion API
+                # Unranked rows are never renumbered, so let Notion leave them
+                # out and return the rest already in ranking order
+                "filter": {"property": RANKING_PROPERTY, "number": {"is_not_empty": True}},
+                "sorts": [{"property": RANKING_PROPERTY, "direction": "ascending"}]
             }
             
             if next_cursor:
                 query_params["start_cursor"] = next_cursor
             
-            response = notion_client.databases.query(**query_params)
+            response = notion_call(notion_client.databases.query, **query_params)
             
-            print(f"📋 Page {page_count}: Found {len(response.get('results', []))} rows")
+            log.info(f"📋 Page {page_count}: Found {len(response.get('results', []))} rows")
             
             for row in response.get("results", []):
-                # Debug: Print available properties for first few rows
+                props = row["properties"]
+                
+                # Debug: Print available properties for first few rows (--debug only)
                 if len(movies) < 3:
-                    print(f"🔍 Debug - Available properties for row {len(movies) + 1}: {list(row['properties'].keys())}")
+                    log.debug(f"🔍 Debug - Available properties for row {len(movies) + 1}: {list(props.keys())}")
                 
                 # Extract movie name
-                name_property = row["properties"].get("Name", {})
+                name_property = props.get(NAME_PROPERTY, {})
                 if name_property.get("title") and len(name_property["title"]) > 0:
                     name = name_property["title"][0]["plain_text"]
                 else:
-                    print(f"⚠️  Skipping row with no name: {row['id']}")
+                    log.warning(f"⚠️  Skipping row with no name: {row['id']}")
                     if len(movies) < 5:  # Debug first few rows
-                        print(f"🔍 Debug - Name property structure: {name_property}")
+                        log.debug(f"🔍 Debug - Name property structure: {name_property}")
                     continue
                 
                 # Extract ranking
-                ranking_property = row["properties"].get("Saleem Ranking", {})
+                ranking_property = props.get(RANKING_PROPERTY, {})
                 ranking = ranking_property.get("number")
                 
                 # Debug: Show ranking info for first few rows
                 if len(movies) < 3:
-                    print(f"🔍 Debug - '{name}' ranking: {ranking} (property: {ranking_property})")
+                    log.debug(f"🔍 Debug - '{name}' ranking: {ranking} (property: {ranking_property})")
                 
-                movies.append({
-                    "page_id": row["id"],
-                    "name": name,
-                    "current_ranking": ranking
-                })
+                movies.append(MovieRow(row["id"], name, ranking))
             
             # Check if there are more pages
             has_more = response.get("has_more", False)
             next_cursor = response.get("next_cursor")
         
-        print(f"📋 Total found: {len(movies)} {content_type} across {page_count} pages")
-        
-        # Additional debug: Show some stats
-        movies_with_ranking = [m for m in movies if m["current_ranking"] is not None]
-        movies_without_ranking = [m for m in movies if m["current_ranking"] is None]
-        print(f"📊 {content_type.title()} with rankings: {len(movies_with_ranking)}")
-        print(f"📊 {content_type.title()} without rankings: {len(movies_without_ranking)}")
+        print(f"📋 Total found: {len(movies)} ranked {content_type} across {page_count} pages")
         
+        QUERY_CACHE.set(cache_key, [asdict(movie) for movie in movies], expire=QUERY_CACHE_TTL)
         return movies
     
     except Exception as e:
         print(f"❌ Error fetching data from Notion: {e}")
-        print(f"🔍 Debug - Exception type: {type(e)}")
+        log.debug(f"🔍 Debug - Exception type: {type(e)}")
         return []
 
 def sort_and_assign_rankings(movies):
     """Sort movies by ranking and assign new integer rankings"""
     print("\n🔄 Processing rankings...")
     
-    # Separate movies with and without rankings
-    movies_with_ranking = [m for m in movies if m["current_ranking"] is not None]
-    movies_without_ranking = [m for m in movies if m["current_ranking"] is None]
+    # Sort movies by their current ranking (ascending); rows from Notion
+    # already arrive in this order, so this is a cheap check
+    movies.sort(key=attrgetter("current_ranking"))
     
-    # Sort movies with rankings by their current ranking (ascending)
-    movies_with_ranking.sort(key=lambda x: x["current_ranking"])
+    # Assign new integer rankings in order
+    for i, movie in enumerate(movies, 1):
+        movie.new_ranking = i
     
-    # Assign new integer rankings only to movies that already have rankings
-    for i, movie in enumerate(movies_with_ranking, 1):
-        movie["new_ranking"] = i
-    
-    # Movies without rankings remain without rankings (None/blank)
-    for movie in movies_without_ranking:
-        movie["new_ranking"] = None
-    
-    # Combine all movies (ranked first, then unranked)
-    all_movies = movies_with_ranking + movies_without_ranking
-    
-    return all_movies
+    return movies
+
+def partition_rankings(movies):
+    """Split movies into (changed, unchanged) lists in a single pass"""
+    changed, unchanged = [], []
+    for movie in movies:
+        if movie.current_ranking != movie.new_ranking:
+            changed.append(movie)
+        else:
+            unchanged.append(movie)
+    return changed, unchanged
 
 def display_ranking_changes(movies):
     """Display the ranking changes that would be made"""
-    print("\n📊 Ranking Changes:")
-    print("=" * 85)
-    print(f"{'Rank':<6} {'Name':<40} {'Current':<12} {'New':<12} {'Change':<15}")
-    print("-" * 85)
-    
     # Separate movies into categories for better display
-    movies_with_changes = []
-    movies_no_change = []
-    movies_no_ranking = []
-    
-    for movie in movies:
-        current = movie["current_ranking"]
-        new = movie["new_ranking"]
-        
-        if current is None and new is None:
-            movies_no_ranking.append(movie)
-        elif current != new:
-            movies_with_changes.append(movie)
-        else:
-            movies_no_change.append(movie)
+    movies_with_changes, movies_no_change = partition_rankings(movies)
     
-    # Display movies with changes first
-    for movie in movies_with_changes:
-        current = movie["current_ranking"]
-        new = movie["new_ranking"]
-        
-        current_str = f"{current}" if current is not None else "None"
-        new_str = f"{new}" if new is not None else "None"
+    # The per-row table is only formatted when it will be shown (not with --quiet),
+    # and is written as one block instead of a line at a time
+    if log.isEnabledFor(logging.INFO):
+        lines = [
+            "\n📊 Ranking Changes:",
+            "=" * 85,
+            f"{'Rank':<6} {'Name':<40} {'Current':<12} {'New':<12} {'Change':<15}",
+            "-" * 85
+        ]
         
-        if current is None:
-            change = "🆕 New ranking"
-        elif new is None:
-            change = "❌ Ranking removed"
-        else:
+        # Display movies with changes first
+        for movie in movies_with_changes:
+            current = movie.current_ranking
+            new = movie.new_ranking
             change = f"🔄 {current} → {new}"
+            lines.append(f"{new:<6} {movie.name:<40} {current:<12} {new:<12} {change:<15}")
         
-        print(f"{new_str:<6} {movie['name']:<40} {current_str:<12} {new_str:<12} {change:<15}")
-    
-    # Display movies with no change
-    for movie in movies_no_change:
-        current = movie["current_ranking"]
-        new = movie["new_ranking"]
-        
-        current_str = f"{current}" if current is not None else "None"
-        new_str = f"{new}" if new is not None else "None"
-        
-        print(f"{new_str:<6} {movie['name']:<40} {current_str:<12} {new_str:<12} {'⚡ No change':<15}")
-    
-    # Display movies without rankings
-    for movie in movies_no_ranking:
-        current_str = "None"
-        new_str = "None"
+        # Display movies with no change
+        for movie in movies_no_change:
+            current = movie.current_ranking
+            new = movie.new_ranking
+            lines.append(f"{new:<6} {movie.name:<40} {current:<12} {new:<12} {'⚡ No change':<15}")
         
-        print(f"{new_str:<6} {movie['name']:<40} {current_str:<12} {new_str:<12} {'📝 No ranking':<15}")
+        lines.append("-" * 85)
+        log.info("\n".join(lines))
     
     # Summary
-    print("-" * 85)
-    print(f"📊 Summary: {len(movies_with_changes)} changes, {len(movies_no_change)} no change, {len(movies_no_ranking)} unranked")
+    print(f"📊 Summary: {len(movies_with_changes)} changes, {len(movies_no_change)} no change")
+
+def update_ranking(notion_client, movie):
+    """Write one movie's new ranking to Notion; returns True on success"""
+    try:
+        # Update the page with new ranking
+        notion_call(
+            notion_client.pages.update,
+            page_id=movie.page_id,
+            properties={
+                RANKING_PROPERTY: {
+                    "number": movie.new_ranking
+                }
+            }
+        )
+        log.info(f"✅ Updated {movie.name}: {movie.new_ranking}")
+        return True
+        
+    except Exception as e:
+        log.error(f"❌ Error updating {movie.name}: {e}")
+        return False
 
 def update_notion_rankings(notion_client, movies, dry_run=True, content_type="movies"):
     """Update the rankings in Notion (or show what would be updated if dry_run=True)"""
     
-    # Filter movies that actually need updates (only those where ranking changed)
-    movies_to_update = [m for m in movies if m["new_ranking"] is not None and m["current_ranking"] != m["new_ranking"]]
-    movies_without_ranking = [m for m in movies if m["new_ranking"] is None]
-    movies_no_change = [m for m in movies if m["new_ranking"] is not None and m["current_ranking"] == m["new_ranking"]]
+    # Only movies whose ranking changed need an update
+    movies_to_update, movies_no_change = partition_rankings(movies)
     
     if dry_run:
         print("\n🔍 DRY RUN MODE - No changes will be made to Notion")
         print(f"📊 {len(movies_to_update)} {content_type} would be updated")
         print(f"📊 {len(movies_no_change)} {content_type} already have correct rankings (no update needed)")
-        print(f"📊 {len(movies_without_ranking)} {content_type} would remain without rankings")
         print("Run with --execute flag to apply changes")
         return
     
     print("\n🔄 Updating rankings in Notion...")
     print(f"📊 Updating {len(movies_to_update)} {content_type} with ranking changes")
     print(f"📊 Skipping {len(movies_no_change)} {content_type} with correct rankings (no update needed)")
-    print(f"📊 Leaving {len(movies_without_ranking)} {content_type} without rankings")
     
-    success_count = 0
-    error_count = 0
-    
-    for movie in movies_to_update:
-        try:
-            # Update the page with new ranking
-            notion_client.pages.update(
-                page_id=movie["page_id"],
-                properties={
-                    "Saleem Ranking": {
-                        "number": movie["new_ranking"]
-                    }
-                }
-            )
-            print(f"✅ Updated {movie['name']}: {movie['new_ranking']}")
-            success_count += 1
-            
-        except Exception as e:
-            print(f"❌ Error updating {movie['name']}: {e}")
-            error_count += 1
+    # Each update only waits on its own round trip, so overlap them
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        results = list(executor.map(lambda movie: update_ranking(notion_client, movie), movies_to_update))
+    success_count = results.count(True)
+    error_count = results.count(False)
     
     print(f"\n📊 Update Summary:")
     print(f"✅ Successfully updated: {success_count}")
     if error_count > 0:
         print(f"❌ Errors: {error_count}")
     print(f"⚡ Skipped (no change needed): {len(movies_no_change)}")
-    print(f"📊 {content_type.title()} left without rankings: {len(movies_without_ranking)}")
 
 def main():
     """Main function"""
@@ -256,7 +273,15 @@ def main():
                        help="Actually update the database (default is dry-run)")
     parser.add_argument("--tv", "--shows", action="store_true", 
                        help="Use TV shows database instead of movies database")
+    parser.add_argument("--refresh", action="store_true",
+                       help="Fetch the rows again instead of reusing a recent dry run's (--execute always fetches)")
+    parser.add_argument("--quiet", action="store_true",
+                       help="Only print warnings, errors and summary counts instead of per-row progress")
+    parser.add_argument("--debug", action="store_true",
+                       help="Also print the raw Notion properties of the first few rows")
     args = parser.parse_args()
+    logging.basicConfig(stream=sys.stdout, format="%(message)s",
+                        level=logging.DEBUG if args.debug else logging.WARNING if args.quiet else logging.INFO)
     
     # Determine database and content type
     use_tv_db = args.tv
@@ -272,12 +297,13 @@ def main():
         return 1
     
     # Initialize Notion client
-    notion = NotionClient(auth=NOTION_KEY)
+    notion = make_notion_client(NOTION_KEY)
     
     # Fetch data
-    movies = fetch_movie_data(notion, database_id, content_type)
+    # Only dry runs reuse cached rows; updates are always computed from fresh data
+    movies = fetch_movie_data(notion, database_id, content_type, use_cache=not (args.execute or args.refresh))
     if not movies:
-        print(f"❌ No {content_type} found or error fetching data")
+        print(f"❌ No ranked {content_type} found or error fetching data")
         return 1
     
     # Sort and assign rankings
@@ -289,6 +315,10 @@ def main():
     # Update Notion (or show what would be updated)
     update_notion_rankings(notion, movies, dry_run=not args.execute, content_type=content_type)
     
+    # The cached rows were read before the updates, so a later dry run must fetch again
+    if args.execute:
+        QUERY_CACHE.delete(query_cache_key(database_id))
+    
     print("\n✅ Script completed successfully!")
     return 0
 